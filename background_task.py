@@ -0,0 +1,37 @@
+# background_task.py
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+
+class TaskSignals(QObject):
+    """сигналы фоновой задачи, доставляются в поток интерфейса"""
+    progress = pyqtSignal(object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+
+class BackgroundTask(QRunnable):
+    """выполняет функцию в QThreadPool, первым аргументом функция получает саму задачу"""
+
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = TaskSignals()
+        self.cancelled = False
+
+    def cancel(self):
+        """просит задачу остановиться, функция сама проверяет task.cancelled"""
+        self.cancelled = True
+
+    def report(self, value):
+        """отправляет прогресс в поток интерфейса"""
+        self.signals.progress.emit(value)
+
+    def run(self):
+        try:
+            result = self.fn(self, *self.args, **self.kwargs)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.finished.emit(result)
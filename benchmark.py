@@ -0,0 +1,259 @@
+# benchmark.py
+"""замеры производительности основных путей менеджера паролей без интерфейса
+
+запуск:
+    python benchmark.py --sizes 1000 100000 --output bench.json
+    python benchmark.py --sizes 1000 --compare bench.json --tolerance 0.2
+
+таблица в окне замеряется под QT_QPA_PLATFORM=offscreen, если установлен PyQt6"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from csv_handler import CSVHandler
+from db_handler import DBHandler
+from password_generator import PasswordGenerator
+import strength_audit
+from strength_audit import StrengthAudit
+from strength_estimator import StrengthEstimator, estimate
+from vault_crypto import VaultCipher
+
+
+def measure(fn, repeat=3):
+    """выполняет fn несколько раз и возвращает лучшее и медианное время в секундах"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {"min": timings[0], "median": timings[len(timings) // 2]}
+
+
+def synthesize_rows(count):
+    """генерирует синтетические записи хранилища"""
+    for i in range(count):
+        yield f"site{i}.example.com", f"user{i % 9973}", f"Pa55word!{i}", f"заметка {i}"
+
+
+def bench_database(size, workdir, repeat):
+    """замеры DBHandler и CSVHandler на хранилище из size записей"""
+    results = {}
+    db = DBHandler(os.path.join(workdir, f"vault_{size}.db"))
+    results[f"db.add_passwords_bulk[{size}]"] = measure(
+        lambda: db.add_passwords_bulk(synthesize_rows(size)), repeat=1
+    )
+    results[f"db.get_passwords[{size}]"] = measure(lambda: db.get_passwords(), repeat)
+    results[f"db.get_passwords.filter[{size}]"] = measure(lambda: db.get_passwords("site42"), repeat)
+    results[f"db.get_passwords.page[{size}]"] = measure(
+        lambda: db.get_passwords("example", limit=200), repeat
+    )
+
+    last_page_key = (f"site{size - 1}.example.com", size)
+    results[f"db.get_passwords_page.first[{size}]"] = measure(
+        lambda: db.get_passwords_page(sort_column="name", limit=200), repeat
+    )
+    results[f"db.get_passwords_page.last[{size}]"] = measure(
+        lambda: db.get_passwords_page(sort_column="name", after_key=last_page_key, limit=200), repeat
+    )
+
+    csv_path = os.path.join(workdir, f"vault_{size}.csv")
+    handler = CSVHandler(db)
+    results[f"csv.export[{size}]"] = measure(lambda: handler.export_to_csv(csv_path), repeat)
+
+    def import_into_fresh_db():
+        target = DBHandler(os.path.join(workdir, f"import_{size}_{time.perf_counter_ns()}.db"))
+        CSVHandler(target).import_from_csv(csv_path)
+        target.close()
+
+    results[f"csv.import[{size}]"] = measure(import_into_fresh_db, repeat=1)
+    db.close()
+    return results
+
+
+def bench_generator(count, repeat):
+    """замеры генератора паролей"""
+    generator = PasswordGenerator(length=16)
+    return {
+        f"generator.generate[{count}]": measure(
+            lambda: [generator.generate() for _ in range(count)], repeat
+        ),
+        f"generator.generate_many[{count}]": measure(lambda: generator.generate_many(count), repeat),
+        f"generator.generate_many.minimums[{count}]": measure(
+            lambda: generator.generate_many(count, 1, 1, 1, 1), repeat
+        ),
+    }
+
+
+def bench_strength(count, repeat):
+    """замеры оценки сложности паролей"""
+    passwords = [f"Pa55word!{i}" for i in range(count)]
+    return {
+        f"strength.is_strong[{count}]": measure(
+            lambda: [PasswordGenerator.is_strong(p) for p in passwords], repeat
+        ),
+        f"strength.evaluate_complexity[{count}]": measure(
+            lambda: [strength_audit.evaluate_complexity(p) for p in passwords], repeat
+        ),
+    }
+
+
+def bench_estimator(count, repeat):
+    """замеры оценщика сложности: разовые оценки и посимвольный набор в поле ввода"""
+    passwords = [f"Pa55word!{i}" for i in range(count)]
+    typed = "Correct-Horse-Battery-Staple-2024!"
+
+    def type_password():
+        estimator = StrengthEstimator()
+        for end in range(1, len(typed) + 1):
+            estimator.estimate(typed[:end])
+
+    return {
+        f"estimator.estimate[{count}]": measure(lambda: [estimate(p) for p in passwords], repeat),
+        f"estimator.keystrokes[{len(typed)}]": measure(type_password, repeat),
+    }
+
+
+def bench_crypto(count, repeat):
+    """замеры вывода ключа и шифрования отдельных значений"""
+    cipher = VaultCipher.create("benchmark master password")
+    passwords = [f"Pa55word!{i}" for i in range(count)]
+    blobs = [cipher.encrypt(p, "password", i) for i, p in enumerate(passwords)]
+    return {
+        "crypto.kdf": measure(lambda: VaultCipher.create("benchmark master password"), repeat),
+        f"crypto.encrypt[{count}]": measure(
+            lambda: [cipher.encrypt(p, "password", i) for i, p in enumerate(passwords)], repeat
+        ),
+        f"crypto.decrypt[{count}]": measure(
+            lambda: [cipher.decrypt(b, "password", i) for i, b in enumerate(blobs)], repeat
+        ),
+    }
+
+
+def bench_audit(size, workdir):
+    """замер полного аудита хранилища и повторного аудита без изменений"""
+    db = DBHandler(os.path.join(workdir, f"vault_{size}.db"))
+    audit = StrengthAudit(db)
+    results = {
+        f"audit.full[{size}]": measure(audit.run, repeat=1),
+        f"audit.incremental[{size}]": measure(audit.run, repeat=1),
+        f"db.get_reuse_groups[{size}]": measure(db.get_reuse_groups, repeat=1),
+    }
+    db.close()
+    return results
+
+
+def bench_import_time(repeat):
+    """время импорта модулей в свежем интерпретаторе по -X importtime
+
+    модули ядра и cli не должны тянуть PyQt6 и тяжелые модули, которые им не нужны"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for module in ("db_handler", "csv_handler", "password_generator", "cli"):
+        timings = []
+        for _ in range(repeat):
+            completed = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                cwd=here, capture_output=True, text=True, check=True,
+            )
+            # последняя строка - сам модуль, вторая колонка - время вместе с зависимостями в мкс
+            for line in completed.stderr.splitlines():
+                if line.rstrip().endswith(f"| {module}"):
+                    timings.append(int(line.split("|")[1]) / 1e6)
+        timings.sort()
+        results[f"import.{module}"] = {"min": timings[0], "median": timings[len(timings) // 2]}
+    return results
+
+
+def bench_table_load(sizes, workdir, repeat):
+    """замеры PasswordManager.load_passwords в окне без дисплея"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PyQt6.QtWidgets import QApplication
+        from main import PasswordManager
+    except ImportError:
+        return {}
+    app = QApplication.instance() or QApplication([])
+    results = {}
+    for size in sizes:
+        window = PasswordManager(db_name=os.path.join(workdir, f"vault_{size}.db"))
+        results[f"ui.load_passwords[{size}]"] = measure(window.load_passwords, repeat)
+        window.close()
+        app.processEvents()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """сравнивает медианы с сохраненным прогоном, возвращает список регрессий"""
+    regressions = []
+    for name, timing in sorted(results.items()):
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        ratio = timing["median"] / previous["median"] if previous["median"] else 1.0
+        status = "РЕГРЕССИЯ" if ratio > 1 + tolerance else "ok"
+        print(f"{status:10} {name:45} {previous['median'] * 1000:10.2f} мс -> "
+              f"{timing['median'] * 1000:10.2f} мс ({ratio:.2f}x)")
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="замеры производительности менеджера паролей")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000],
+                        help="размеры синтетических хранилищ, например 1000 100000 1000000")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов каждого замера")
+    parser.add_argument("--generate-count", type=int, default=100000,
+                        help="сколько паролей генерировать и оценивать")
+    parser.add_argument("--skip-ui", action="store_true", help="не замерять таблицу в окне")
+    parser.add_argument("--output", help="куда сохранить результаты в json")
+    parser.add_argument("--compare", help="json с базовым прогоном для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="допустимое замедление относительно базового прогона")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            results.update(bench_database(size, workdir, args.repeat))
+            results.update(bench_audit(size, workdir))
+        results.update(bench_generator(args.generate_count, args.repeat))
+        results.update(bench_strength(args.generate_count, args.repeat))
+        results.update(bench_estimator(args.generate_count // 10, args.repeat))
+        results.update(bench_crypto(args.generate_count, args.repeat))
+        results.update(bench_import_time(args.repeat))
+        if not args.skip_ui:
+            results.update(bench_table_load(args.sizes, workdir, args.repeat))
+
+    report = {
+        "meta": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "sizes": args.sizes,
+            "timestamp": time.time(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    else:
+        for name, timing in sorted(results.items()):
+            print(f"{name:45} {timing['median'] * 1000:10.2f} мс")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
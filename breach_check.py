@@ -0,0 +1,135 @@
+# breach_check.py
+import hashlib
+import mmap
+import os
+from array import array
+
+HASH_LENGTH = 40
+# индекс по первым четырем hex-символам хэша
+PREFIX_LENGTH = 4
+PREFIX_BUCKETS = 16 ** PREFIX_LENGTH
+
+
+def sha1_hex(password):
+    """sha-1 пароля в верхнем регистре, как в файлах утечек"""
+    return hashlib.sha1(password.encode("utf-8")).hexdigest().upper().encode("ascii")
+
+
+class BreachCorpus:
+    """поиск паролей в локальном файле утечек без сети
+
+    файл - строки вида HASH:count, отсортированные по sha-1 в верхнем регистре.
+    файл отображается в память и ищется бинарным поиском прямо по страницам,
+    необязательный индекс по префиксам сужает поиск до одной корзины"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._size else b""
+        # срезы memoryview не копируют данные файла
+        self._view = memoryview(self._mmap)
+        self._index = None
+
+    def close(self):
+        self._view.release()
+        if self._size:
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def index_path(self):
+        return self.path + ".idx"
+
+    def ensure_index(self):
+        """загружает индекс префиксов из файла рядом с корпусом или строит его"""
+        if self._index is not None:
+            return
+        index = array("Q")
+        try:
+            if os.path.getmtime(self.index_path) >= os.path.getmtime(self.path):
+                with open(self.index_path, "rb") as file:
+                    index.fromfile(file, PREFIX_BUCKETS + 1)
+                if index[-1] == self._size:
+                    self._index = index
+                    return
+        except (OSError, EOFError):
+            pass
+        self._index = self.build_index()
+        try:
+            with open(self.index_path, "wb") as file:
+                self._index.tofile(file)
+        except OSError:
+            # индекс останется только в памяти, если рядом с корпусом нельзя писать
+            pass
+
+    def build_index(self):
+        """находит начало каждой корзины префиксов бинарным поиском, без чтения всего файла"""
+        index = array("Q", [0]) * (PREFIX_BUCKETS + 1)
+        lo = 0
+        for prefix in range(PREFIX_BUCKETS):
+            lo = self._lower_bound(b"%04X" % prefix, lo, self._size)
+            index[prefix] = lo
+        index[PREFIX_BUCKETS] = self._size
+        return index
+
+    def count(self, password):
+        """сколько раз пароль встречался в утечках, 0 - не найден"""
+        return self.count_hash(sha1_hex(password))
+
+    def count_hash(self, digest):
+        """ищет sha-1 в виде 40 hex-символов верхнего регистра"""
+        lo, hi = 0, self._size
+        if self._index is not None:
+            prefix = int(digest[:PREFIX_LENGTH], 16)
+            lo, hi = self._index[prefix], self._index[prefix + 1]
+        start = self._lower_bound(digest, lo, hi)
+        if start >= hi or self._view[start:start + HASH_LENGTH] != digest:
+            return 0
+        end = self._mmap.find(b"\n", start)
+        if end < 0:
+            end = self._size
+        count = bytes(self._view[start + HASH_LENGTH + 1:end]).strip()
+        return int(count) if count else 1
+
+    def _lower_bound(self, target, lo, hi):
+        """первое начало строки в [lo, hi), чей ключ не меньше target
+
+        lo и hi должны быть началами строк (или концом файла)"""
+        width = len(target)
+        value = int.from_bytes(target, "big")
+        view = self._view
+        while lo < hi:
+            mid = (lo + hi) // 2
+            newline = self._mmap.rfind(b"\n", lo, mid)
+            start = lo if newline < 0 else newline + 1
+            if int.from_bytes(view[start:start + width], "big") < value:
+                end = self._mmap.find(b"\n", start, hi)
+                lo = hi if end < 0 else end + 1
+            else:
+                hi = start
+        return lo
+
+
+def check_vault(task, db, corpus):
+    """проверяет все пароли хранилища, возвращает [(id, name, username, count)] найденных
+
+    task - BackgroundTask (или None вне интерфейса): прогресс приходит числом
+    проверенных паролей, после отмены возвращается то, что успели найти"""
+    corpus.ensure_index()
+    found = []
+    for checked, (password_id, name, username, password) in enumerate(db.iter_credentials(), 1):
+        count = corpus.count(password)
+        if count:
+            found.append((password_id, name, username, count))
+        if task is not None and checked % 1000 == 0:
+            if task.cancelled:
+                break
+            task.report(checked)
+    return found
@@ -0,0 +1,60 @@
+# change_watcher.py
+import sqlite3
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+from exceptions import DatabaseError
+
+
+class ChangeWatcher(QObject):
+    """следит за изменениями базы, сделанными другими окнами и процессами
+
+    по таймеру читает PRAGMA data_version: пока счетчик не изменился, база не
+    читается вовсе. после чужой фиксации загружаются только строки, измененные
+    после последней отметки, и вливаются в кэш и таблицу"""
+
+    changed = pyqtSignal(int, int)  # изменено или добавлено, удалено
+
+    def __init__(self, cache, model, interval=1000, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.model = model
+        self._version = None
+        self._marker = None
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self.poll)
+
+    def start(self):
+        """запоминает текущее состояние базы и начинает опрос"""
+        self.reset()
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+
+    def reset(self):
+        """принимает текущее состояние базы за уже показанное, например после полной перезагрузки"""
+        db = self.cache.db
+        self._version = db.data_version()
+        self._marker = db.get_change_marker()
+
+    def poll(self):
+        """проверяет счетчик версии и подтягивает изменения, если он сдвинулся"""
+        db = self.cache.db
+        try:
+            version = db.data_version()
+            if version == self._version:
+                return
+            rows, deleted_ids, marker = db.get_changes_since(self._marker)
+        except (DatabaseError, sqlite3.Error):
+            # база занята дольше busy_timeout или недоступна: попробуем на следующем тике
+            return
+        self._version = version
+        self._marker = marker
+        self.cache.invalidate(deleted_ids)
+        self.cache.refresh(rows)
+        self.model.merge_rows([row[0] for row in rows], deleted_ids)
+        if rows or deleted_ids:
+            self.changed.emit(len(rows), len(deleted_ids))
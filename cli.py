@@ -0,0 +1,243 @@
+# cli.py
+"""командная строка менеджера паролей, работает без PyQt6 и без дисплея
+
+запуск:
+    python -m cli query site --sort name --limit 20
+    python -m cli add example.com user --generate
+    python -m cli export пароли.csv.gz
+    python -m cli import пароли.csv --dedup
+    python -m cli generate --length 20 --count 5
+    python -m cli audit
+    python -m cli encrypt
+    python -m cli merge команда.db --policy newest --dry-run
+    python -m cli dictionary words.txt dictionary.bin
+
+мастер-пароль зашифрованной базы спрашивается без эха или берется
+из переменной окружения PASSWORD_MANAGER_MASTER_PASSWORD
+
+модули хранилища импортируются внутри команд, поэтому python -m cli generate
+не открывает базу и не тянет sqlite3"""
+import sys
+
+
+def open_db(args):
+    """открывает базу; у зашифрованной спрашивает мастер-пароль или берет его из окружения"""
+    import os
+    from db_handler import DBHandler
+
+    db = DBHandler(args.db)
+    if db.encrypted:
+        master_password = os.environ.get("PASSWORD_MANAGER_MASTER_PASSWORD")
+        if master_password is None:
+            import getpass
+            master_password = getpass.getpass("Мастер-пароль: ")
+        db.unlock(master_password)
+    return db
+
+
+def cmd_query(args):
+    """печатает записи через табуляцию, страницы читаются по ключу, а не целиком"""
+    db = open_db(args)
+    printed = 0
+    after_key = None
+    while args.limit is None or printed < args.limit:
+        page_size = 1000 if args.limit is None else min(1000, args.limit - printed)
+        rows = db.get_passwords_page(args.filter, args.sort, args.desc, after_key, page_size)
+        for password_id, name, username, password, note in (row[:5] for row in rows):
+            shown = db.reveal(password, "password", password_id) if args.show_passwords else "***"
+            print(password_id, name, username, shown, db.reveal(note, "note", password_id) or "", sep="\t")
+        printed += len(rows)
+        if len(rows) < page_size:
+            break
+        after_key = db.page_key(rows[-1], args.sort)
+    db.close()
+    return 0
+
+
+def cmd_add(args):
+    from password_generator import PasswordGenerator
+
+    if args.generate:
+        password = PasswordGenerator(length=args.length).generate()
+    elif args.password is not None:
+        password = args.password
+    else:
+        import getpass
+        password = getpass.getpass("Пароль: ")
+    if not password:
+        print("Пароль не может быть пустым.", file=sys.stderr)
+        return 1
+    db = open_db(args)
+    password_id = db.add_password(args.name, args.username, password, args.note)
+    db.close()
+    if password_id is None:
+        print("Не удалось сохранить пароль.", file=sys.stderr)
+        return 1
+    print(password_id)
+    return 0
+
+
+def cmd_export(args):
+    from csv_handler import CSVHandler
+
+    db = open_db(args)
+    written = CSVHandler(db).export_to_csv(args.file)
+    db.close()
+    print(f"Экспортировано записей: {written}", file=sys.stderr)
+    return 0
+
+
+def cmd_import(args):
+    from csv_handler import CSVHandler
+
+    db = open_db(args)
+    imported = CSVHandler(db).import_from_csv(args.file, dedup=args.dedup)
+    db.close()
+    print(f"Импортировано записей: {imported}", file=sys.stderr)
+    return 0
+
+
+def cmd_generate(args):
+    from password_generator import PasswordGenerator
+
+    generator = PasswordGenerator(args.length, not args.no_digits, not args.no_special)
+    try:
+        passwords = generator.generate_many(args.count)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print("\n".join(passwords))
+    return 0
+
+
+def cmd_audit(args):
+    import json
+    from strength_audit import StrengthAudit
+
+    db = open_db(args)
+    report = StrengthAudit(db).run()
+    db.close()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+def cmd_encrypt(args):
+    """шифрует открытое хранилище или дошифровывает прерванный перевод"""
+    import getpass
+
+    db = open_db(args)
+    if db.encrypted:
+        count = db.encrypt_remaining()
+    else:
+        master_password = getpass.getpass("Новый мастер-пароль: ")
+        if len(master_password) < 8 or master_password != getpass.getpass("Повторите мастер-пароль: "):
+            print("Мастер-пароль короче 8 символов или пароли не совпадают.", file=sys.stderr)
+            db.close()
+            return 1
+        count = db.encrypt_vault(master_password)
+    db.close()
+    print(f"Зашифровано записей: {count}", file=sys.stderr)
+    return 0
+
+
+def cmd_merge(args):
+    """вливает другую базу; с --dry-run только печатает, что изменится"""
+    import json
+    from exceptions import VaultLockedError
+
+    db = open_db(args)
+    try:
+        report = db.merge_from(args.source, args.policy, dry_run=args.dry_run)
+    except VaultLockedError:
+        import getpass
+        master_password = getpass.getpass("Мастер-пароль другой базы: ")
+        report = db.merge_from(args.source, args.policy, dry_run=args.dry_run, master_password=master_password)
+    db.close()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+def cmd_dictionary(args):
+    """собирает файл словаря для оценки сложности из списка слов по убыванию частоты"""
+    from strength_estimator import compile_dictionary
+
+    with open(args.words, encoding="utf-8", errors="ignore") as file:
+        count = compile_dictionary(file, args.output)
+    print(f"Слов в словаре: {count}", file=sys.stderr)
+    return 0
+
+
+def build_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m cli", description="менеджер паролей без интерфейса")
+    parser.add_argument("--db", default="passwords.db", help="файл базы паролей")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    query = commands.add_parser("query", help="вывести записи")
+    query.add_argument("filter", nargs="?", default="", help="текст для поиска по названию и логину")
+    query.add_argument("--sort", choices=("id", "name", "username"), default="id")
+    query.add_argument("--desc", action="store_true", help="по убыванию")
+    query.add_argument("--limit", type=int, help="не больше стольких записей")
+    query.add_argument("--show-passwords", action="store_true", help="не маскировать пароли")
+    query.set_defaults(handler=cmd_query)
+
+    add = commands.add_parser("add", help="добавить запись")
+    add.add_argument("name")
+    add.add_argument("username")
+    source = add.add_mutually_exclusive_group()
+    source.add_argument("--password", help="пароль (иначе будет запрошен без эха)")
+    source.add_argument("--generate", action="store_true", help="сгенерировать пароль")
+    add.add_argument("--length", type=int, default=16, help="длина генерируемого пароля")
+    add.add_argument("--note", default="")
+    add.set_defaults(handler=cmd_add)
+
+    export = commands.add_parser("export", help="экспорт в csv (.gz - со сжатием)")
+    export.add_argument("file")
+    export.set_defaults(handler=cmd_export)
+
+    import_ = commands.add_parser("import", help="импорт из csv")
+    import_.add_argument("file")
+    import_.add_argument("--dedup", action="store_true", help="обновлять записи с тем же названием и логином")
+    import_.set_defaults(handler=cmd_import)
+
+    generate = commands.add_parser("generate", help="сгенерировать пароли, база не нужна")
+    generate.add_argument("--length", type=int, default=16)
+    generate.add_argument("--count", type=int, default=1)
+    generate.add_argument("--no-digits", action="store_true")
+    generate.add_argument("--no-special", action="store_true")
+    generate.set_defaults(handler=cmd_generate)
+
+    audit = commands.add_parser("audit", help="аудит сложности и повторов паролей")
+    audit.set_defaults(handler=cmd_audit)
+
+    encrypt = commands.add_parser("encrypt", help="зашифровать пароли и заметки в базе")
+    encrypt.set_defaults(handler=cmd_encrypt)
+
+    merge = commands.add_parser("merge", help="влить записи другой базы паролей")
+    merge.add_argument("source", help="файл другой базы")
+    merge.add_argument("--policy", choices=("newest", "local", "both"), default="newest",
+                       help="что делать с разными записями под одними названием и логином")
+    merge.add_argument("--dry-run", action="store_true", help="только показать изменения")
+    merge.set_defaults(handler=cmd_merge)
+
+    dictionary = commands.add_parser("dictionary", help="собрать словарь для оценки сложности паролей")
+    dictionary.add_argument("words", help="текстовый файл: одно слово в строке, частые первыми")
+    dictionary.add_argument("output", help="файл словаря, путь к нему задает PASSWORD_MANAGER_DICTIONARY")
+    dictionary.set_defaults(handler=cmd_dictionary)
+    return parser
+
+
+def main(argv=None):
+    from exceptions import PasswordManagerError
+
+    args = build_parser().parse_args(argv)
+    try:
+        return args.handler(args)
+    except (PasswordManagerError, OSError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
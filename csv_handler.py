@@ -1,24 +1,84 @@
 # csv_handler.py
-import csv
-from db_handler import DBHandler
+# csv и gzip импортируются внутри методов: модуль нужен и сценариям, которые их не используют
+import io
+from itertools import islice
+
 
 class CSVHandler:
     def __init__(self, db_handler):
         self.db_handler = db_handler
 
-    def export_to_csv(self, file_name="пароли.csv"):
-        """экспортирует данные из базы данных в csv-файл"""
-        passwords = self.db_handler.get_passwords()
-        with open(file_name, "w", newline="") as file:
+    def export_to_csv(self, file_name="пароли.csv", compress=None, progress_callback=None,
+                      batch_size=1000):
+        """экспортирует данные из базы данных в csv-файл, возвращает количество строк
+
+        строки пишутся по мере чтения курсора, поэтому память не растет с размером базы.
+        compress=None включает gzip по расширению .gz, progress_callback(rows) вызывается
+        после каждой пачки"""
+        import csv
+        import gzip
+
+        if compress is None:
+            compress = file_name.endswith(".gz")
+        if compress:
+            file = gzip.open(file_name, "wt", newline="", encoding="utf-8")
+        else:
+            file = open(file_name, "w", newline="", encoding="utf-8")
+
+        written = 0
+        with file:
             writer = csv.writer(file)
             writer.writerow(["Название", "Логин", "Пароль", "Заметка"])
-            writer.writerows(passwords)
-
-    def import_from_csv(self, file_name="пароли.csv"):
-        """импортирует данные из csv-файла в базу данных"""
-        with open(file_name, "r") as file:
-            reader = csv.reader(file)
-            next(reader)  # пропустить заголовок
-            for row in reader:
-                title, username, password, note = row
-                self.db_handler.add_password(title, username, password, note)
+            rows = self.db_handler.iter_export_rows(batch_size=batch_size)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                writer.writerows(batch)
+                written += len(batch)
+                if progress_callback is not None:
+                    progress_callback(written)
+        return written
+
+    def import_from_csv(self, file_name="пароли.csv", dedup=False, chunk_size=1000):
+        """импортирует данные из csv-файла в базу данных, возвращает количество строк"""
+        return self.db_handler.add_passwords_bulk(
+            self.read_rows(file_name), chunk_size=chunk_size, dedup=dedup
+        )
+
+    @staticmethod
+    def read_records(file_name):
+        """построчно читает csv-файл (или .gz) и отдает (номер строки, поля, прочитано байт файла)"""
+        import csv
+        import gzip
+
+        with open(file_name, "rb") as raw:
+            stream = gzip.GzipFile(fileobj=raw) if file_name.endswith(".gz") else raw
+            with io.TextIOWrapper(stream, encoding="utf-8", newline="") as file:
+                reader = csv.reader(file)
+                next(reader, None)  # пропустить заголовок
+                for row in reader:
+                    yield reader.line_num, row, raw.tell()
+
+    @staticmethod
+    def validate_row(row):
+        """проверяет поля строки, возвращает (запись, None) или (None, причина отказа)"""
+        if len(row) == 5:
+            # старые экспорты содержат id первой колонкой
+            row = row[1:]
+        if len(row) != 4:
+            return None, f"ожидалось 4 поля, получено {len(row)}"
+        title, username, password, note = row
+        if not title or not username or not password:
+            return None, "не заполнены название, логин или пароль"
+        return (title, username, password, note), None
+
+    @classmethod
+    def read_rows(cls, file_name):
+        """построчно читает csv-файл и отдает корректные кортежи (name, username, password, note)"""
+        for _, row, _ in cls.read_records(file_name):
+            if not row:  # пропускаем пустые строки
+                continue
+            record, _ = cls.validate_row(row)
+            if record is not None:
+                yield record
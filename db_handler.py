@@ -1,67 +1,1305 @@
 #db_handler.py
+import hmac
+import os
 import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from itertools import islice
+
+from exceptions import DatabaseError, VaultLockedError
+from vault_crypto import VaultCipher
+
+# триггеры, которые держат fts-индекс в синхронизации с таблицей passwords
+FTS_TRIGGERS = ("passwords_fts_insert", "passwords_fts_delete", "passwords_fts_update")
+# в индекс попадают только открытые заметки, зашифрованные (blob) индексируются как NULL
+FTS_NOTE = "CASE WHEN typeof({row}.note) = 'text' THEN {row}.note END"
+# с такой пачки импорт снимает построчные триггеры fts и обновляет индекс одним запросом
+FTS_BULK_ROWS = 256
+
+# миграции схемы по порядку: после i-й миграции PRAGMA user_version равна i + 1
+MIGRATIONS = ("_migrate_base_schema", "_migrate_lookup_indexes", "_migrate_timestamps",
+              "_migrate_tombstones", "_migrate_fts_plaintext_notes", "_migrate_drop_unique_key",
+              "_migrate_rescore_strength")
+
+# колонки, по которым get_passwords_page умеет сортировать, и их номера в строке таблицы
+SORT_COLUMNS = {"id": 0, "name": 1, "username": 2}
+
+# текущее время с миллисекундами, строки такого вида сравниваются как время
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+EPOCH = "1970-01-01 00:00:00.000"
+# обновление записей импорта, которые уже есть в базе; updated_at пишется явно,
+# иначе триггер passwords_touch обновил бы строку второй раз
+UPSERT_UPDATE = f"UPDATE passwords SET password = ?, note = ?, fingerprint = ?, updated_at = {NOW} WHERE id = ?"
+# новая запись с заранее выданным id, к нему привязан шифротекст
+INSERT_ROW = (
+    "INSERT INTO passwords (id, name, username, password, note, fingerprint, created_at, updated_at) "
+    f"VALUES (?, ?, ?, ?, ?, ?, {NOW}, {NOW})"
+)
+# номер колонки updated_at в строке SELECT * FROM passwords
+UPDATED_AT_COLUMN = 8
+# как merge_from решает спор записей с одинаковыми названием и логином
+MERGE_POLICIES = ("newest", "local", "both")
+
+
+def _log_error(message, error):
+    """пишет ошибку в лог; logging тянет за собой re и traceback, поэтому импортируется при первой ошибке"""
+    import logging
+    logging.getLogger(__name__).error(message, error)
+
+
+class _ThreadConnection:
+    """держатель соединения в threading.local: умирает вместе с потоком"""
+    __slots__ = ("__weakref__",)
+
+
+def _release_connection(connection, connections, lock):
+    """закрывает соединение завершившегося потока и забывает его"""
+    with lock:
+        if connection in connections:
+            connections.remove(connection)
+    try:
+        connection.close()
+    except sqlite3.Error:
+        pass
 
 
 class DBHandler:
-    def __init__(self, db_name="passwords.db"):
+    def __init__(self, db_name="passwords.db", journal_mode="WAL", synchronous="NORMAL",
+                 busy_timeout=5000, cached_statements=256, instrumentation=None):
         self.db_name = db_name
+        # необязательный сборщик статистики запросов (QueryStats), без него замеров нет
+        self.instrumentation = instrumentation
+        # параметры соединения, применяются к каждому новому подключению
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+
+        # у каждого потока своё соединение, оно живет, пока жив поток
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
         self.create_table()
 
+    @property
+    def connection(self):
+        """возвращает соединение текущего потока, открывая его при первом обращении"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            # потоки QThreadPool завершаются после простоя, а рабочие потоки поиска и
+            # импорта не знают о DBHandler: соединение закрывается, когда данные
+            # потока уничтожаются, иначе каждый новый поток оставлял бы открытый файл
+            holder = _ThreadConnection()
+            weakref.finalize(holder, _release_connection, connection, self._connections, self._lock)
+            self._local.holder = holder
+            self._local.connection = connection
+            self._local.depth = 0
+        return connection
+
+    def _connect(self):
+        """открывает и настраивает новое соединение"""
+        # isolation_level=None: вне transaction() каждый запрос фиксируется сразу
+        connection = sqlite3.connect(
+            self.db_name,
+            timeout=self.busy_timeout / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        connection.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        if self.journal_mode:
+            connection.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        if self.synchronous:
+            connection.execute(f"PRAGMA synchronous = {self.synchronous}")
+        with self._lock:
+            self._connections.append(connection)
+        return connection
+
+    def close(self):
+        """закрывает все открытые соединения"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            try:
+                # sqlite сам решает, каким индексам нужна свежая статистика
+                connection.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            connection.close()
+        self._local = threading.local()
+
+    @property
+    def in_transaction(self):
+        """True, если текущий поток находится внутри transaction()"""
+        return getattr(self._local, "depth", 0) > 0
+
+    @contextmanager
+    def transaction(self):
+        """группирует запросы в одну транзакцию, вложенные вызовы используют savepoint
+
+        ошибки начала и фиксации транзакции (например, база занята другим процессом)
+        выбрасываются как DatabaseError, соединение после них остается вне транзакции"""
+        connection = self.connection
+        depth = self._local.depth
+        try:
+            if depth == 0:
+                connection.execute("BEGIN IMMEDIATE")
+            else:
+                connection.execute(f"SAVEPOINT sp_{depth}")
+        except sqlite3.Error as e:
+            raise DatabaseError(str(e)) from e
+        self._local.depth = depth + 1
+        try:
+            yield connection
+        except BaseException:
+            self._local.depth = depth
+            self._rollback(connection, depth)
+            raise
+        try:
+            if depth == 0:
+                connection.execute("COMMIT")
+            else:
+                connection.execute(f"RELEASE sp_{depth}")
+        except sqlite3.Error as e:
+            # иначе соединение осталось бы в открытой транзакции при depth == 0,
+            # и все следующие записи этого потока молча не фиксировались бы
+            self._rollback(connection, depth)
+            raise DatabaseError(str(e)) from e
+        finally:
+            self._local.depth = depth
+
+    @staticmethod
+    def _rollback(connection, depth):
+        """откатывает транзакцию или savepoint уровня depth"""
+        if depth == 0:
+            # sqlite мог уже сам откатить транзакцию после ошибки
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+        else:
+            connection.execute(f"ROLLBACK TO sp_{depth}")
+            connection.execute(f"RELEASE sp_{depth}")
+
+    @contextmanager
+    def interruptible(self, is_cancelled, interval=1000):
+        """прерывает запросы текущего потока, как только is_cancelled() вернет True
+
+        sqlite вызывает обработчик каждые interval инструкций виртуальной машины,
+        прерванный запрос завершается ошибкой sqlite3.OperationalError"""
+        connection = self.connection
+        local = self._local
+
+        def handler():
+            if is_cancelled():
+                # execute_query узнает по флагу, что ошибка - это прерывание, а не сбой
+                local.interrupted = True
+                return 1
+            return 0
+
+        local.interrupted = False
+        connection.set_progress_handler(handler, interval)
+        try:
+            yield
+        finally:
+            connection.set_progress_handler(None, 0)
+            local.interrupted = False
+
     def create_table(self):
-        """создает таблицу, если она не существует"""
-        query = '''
+        """создает таблицу или обновляет схему старой базы до текущей версии"""
+        self.migrate()
+        self.create_search_index()
+        self.load_cipher()
+        self.load_fingerprint_key()
+        self.prune_tombstones()
+
+    def migrate(self):
+        """применяет недостающие миграции схемы, версия хранится в PRAGMA user_version"""
+        connection = self.connection
+        if self._schema_version() >= len(MIGRATIONS):
+            return
+        with self.transaction():
+            # версию перечитываем под блокировкой записи: другой процесс мог успеть обновить базу
+            version = self._schema_version()
+            for migration in MIGRATIONS[version:]:
+                getattr(self, migration)(connection)
+            connection.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+        # обновляем статистику планировщика по выборке строк, а не по всей таблице
+        connection.execute("PRAGMA analysis_limit = 1000")
+        connection.execute("ANALYZE")
+
+    def _schema_version(self):
+        return self.connection.execute("PRAGMA user_version").fetchone()[0]
+
+    def _migrate_base_schema(self, connection):
+        """версия 1: таблицы, кэш оценок сложности и отпечатки паролей
+
+        базы, созданные до появления версий, тоже проходят эту миграцию,
+        поэтому она не ломается на уже существующих таблицах и колонках"""
+        connection.execute('''
         CREATE TABLE IF NOT EXISTS passwords (
             id INTEGER PRIMARY KEY,
             name TEXT NOT NULL,
             username TEXT NOT NULL,
             password TEXT NOT NULL,
-            note TEXT
+            note TEXT,
+            strength INTEGER,
+            fingerprint BLOB
+        )
+        ''')
+        connection.execute("CREATE TABLE IF NOT EXISTS vault_meta (key TEXT PRIMARY KEY, value BLOB)")
+        self._ensure_column("strength", "INTEGER")
+        self._ensure_column("fingerprint", "BLOB")
+
+        # частичный индекс хранит только неоцененные строки, поэтому их поиск не читает всю таблицу
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_passwords_unscored ON passwords (id) WHERE strength IS NULL"
+        )
+        # смена пароля сбрасывает оценку, если запрос не записал её сам
+        connection.execute("""
+        CREATE TRIGGER IF NOT EXISTS passwords_strength_reset
+        AFTER UPDATE OF password ON passwords WHEN new.strength IS old.strength BEGIN
+            UPDATE passwords SET strength = NULL WHERE id = new.id;
+        END
+        """)
+
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_passwords_fingerprint ON passwords (fingerprint)"
+        )
+        # то же для отпечатка пароля
+        connection.execute("""
+        CREATE TRIGGER IF NOT EXISTS passwords_fingerprint_reset
+        AFTER UPDATE OF password ON passwords WHEN new.fingerprint IS old.fingerprint BEGIN
+            UPDATE passwords SET fingerprint = NULL WHERE id = new.id;
+        END
+        """)
+
+    def _migrate_lookup_indexes(self, connection):
+        """версия 2: индексы по названию и логину для поиска и сортировки"""
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_passwords_name ON passwords (name)")
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_passwords_username ON passwords (username)")
+
+    def _migrate_timestamps(self, connection):
+        """версия 3: время создания и изменения записей
+
+        колонки добавляются с постоянным значением по умолчанию, поэтому ALTER TABLE
+        не переписывает таблицу; у старых записей время неизвестно и равно EPOCH"""
+        self._ensure_column("created_at", f"TEXT NOT NULL DEFAULT '{EPOCH}'")
+        self._ensure_column("updated_at", f"TEXT NOT NULL DEFAULT '{EPOCH}'")
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_passwords_updated_at ON passwords (updated_at)")
+        # любое изменение данных записи обновляет updated_at, если запрос не записал его сам
+        connection.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS passwords_touch
+        AFTER UPDATE OF name, username, password, note ON passwords
+        WHEN new.updated_at IS old.updated_at BEGIN
+            UPDATE passwords SET updated_at = {NOW} WHERE id = new.id;
+        END
+        """)
+
+    def _migrate_tombstones(self, connection):
+        """версия 4: журнал удаленных записей, чтобы другие окна узнали об удалении"""
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS deleted_passwords (id INTEGER PRIMARY KEY, deleted_at TEXT NOT NULL)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_deleted_passwords_deleted_at ON deleted_passwords (deleted_at)"
         )
-        '''
-        self.execute_query(query)
+        connection.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS passwords_tombstone AFTER DELETE ON passwords BEGIN
+            INSERT OR REPLACE INTO deleted_passwords (id, deleted_at) VALUES (old.id, {NOW});
+        END
+        """)
+        # sqlite может выдать id удаленной записи новой, тогда отметка об удалении больше не нужна
+        connection.execute("""
+        CREATE TRIGGER IF NOT EXISTS passwords_tombstone_clear AFTER INSERT ON passwords BEGIN
+            DELETE FROM deleted_passwords WHERE id = new.id;
+        END
+        """)
+
+    def _migrate_fts_plaintext_notes(self, connection):
+        """версия 5: fts-индекс не должен хранить шифротексты заметок
+
+        триггеры удаляются, create_search_index создаст их заново с FTS_NOTE
+        и переиндексирует таблицу"""
+        for trigger in FTS_TRIGGERS:
+            connection.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+    def _migrate_drop_unique_key(self, connection):
+        """версия 6: убирает уникальный индекс по (name, username)
+
+        его создавал импорт без дубликатов, после чего обычное добавление записи
+        с тем же названием и логином молча не сохранялось. теперь импорт ищет
+        существующие ключи сам"""
+        connection.execute("DROP INDEX IF EXISTS idx_passwords_name_username")
+
+    def _migrate_rescore_strength(self, connection):
+        """версия 7: сбрасывает оценки сложности, посчитанные по числу классов символов
+
+        аудит переоценит записи тем же оценщиком, что и индикатор в окне"""
+        connection.execute("UPDATE passwords SET strength = NULL")
+
+    def _ensure_column(self, column, definition):
+        """добавляет колонку в таблицу passwords, если её нет в старой базе"""
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(passwords)")}
+        if column not in columns:
+            self.connection.execute(f"ALTER TABLE passwords ADD COLUMN {column} {definition}")
+
+    def get_meta(self, key, default=None):
+        """читает служебное значение хранилища"""
+        result = self.execute_query("SELECT value FROM vault_meta WHERE key = ?", (key,))
+        return result[0][0] if result else default
+
+    def set_meta(self, key, value):
+        """записывает служебное значение хранилища"""
+        self.execute_query(
+            "INSERT INTO vault_meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+
+    def load_cipher(self):
+        """читает параметры шифрования; у зашифрованного хранилища ключ появится после unlock"""
+        salt = self.get_meta("kdf_salt")
+        self.cipher = None if salt is None else VaultCipher.from_params(salt, self.get_meta("kdf_params"))
+
+    @property
+    def encrypted(self):
+        return self.cipher is not None
+
+    @property
+    def locked(self):
+        if self.cipher is None or not self.cipher.locked:
+            return False
+        # ключ мог забыться по простою, подключ отпечатков выведен из него же
+        self.fingerprint_key = None
+        return True
+
+    def unlock(self, master_password):
+        """выводит ключ хранилища из мастер-пароля, один раз на сессию"""
+        self.cipher.unlock(master_password, self.get_meta("kdf_verifier"))
+        self.fingerprint_key = self.cipher.subkey(b"fingerprint")
+
+    def lock(self):
+        """забывает ключ хранилища и выведенный из него ключ отпечатков"""
+        if self.cipher is not None:
+            self.cipher.lock()
+            self.fingerprint_key = None
+
+    def seal(self, value, column, password_id):
+        """шифрует значение колонки password или note записи password_id, если хранилище зашифровано"""
+        if self.cipher is None or value is None:
+            return value
+        return self.cipher.encrypt(value, column, password_id)
+
+    def reveal(self, value, column, password_id):
+        """расшифровывает значение, прочитанное из колонки password или note записи password_id
+
+        открытые строки возвращаются как есть: так читаются и старые базы,
+        и записи, до которых еще не дошла encrypt_vault"""
+        if not isinstance(value, bytes):
+            return value
+        if self.cipher is None:
+            raise VaultLockedError()
+        return self.cipher.decrypt(value, column, password_id)
+
+    def encrypt_vault(self, master_password, batch_size=1000, progress_callback=None):
+        """переводит открытое хранилище в зашифрованное на месте, возвращает число записей
+
+        строки читаются и переписываются пачками по ключу, одна транзакция на пачку.
+        параметры ключа записываются первыми, а открытые строки узнаются по типу
+        значения, поэтому прерванный перевод продолжается повторным вызовом
+        encrypt_remaining после unlock"""
+        if self.cipher is not None:
+            raise DatabaseError("Хранилище уже зашифровано.")
+        cipher = VaultCipher.create(master_password)
+        with self.transaction():
+            self.set_meta("kdf_salt", cipher.salt)
+            self.set_meta("kdf_params", cipher.params)
+            self.set_meta("kdf_verifier", cipher.verifier())
+        self.cipher = cipher
+        self.fingerprint_key = cipher.subkey(b"fingerprint")
+        return self.encrypt_remaining(batch_size, progress_callback)
+
+    def encrypt_remaining(self, batch_size=1000, progress_callback=None):
+        """шифрует записи, которые еще хранятся открытым текстом"""
+        connection = self.connection
+        # затираем освобожденные страницы, чтобы открытый текст не остался в файле
+        connection.execute("PRAGMA secure_delete = ON")
+        total = 0
+        after_id = 0
+        try:
+            while True:
+                with self.transaction():
+                    rows = self.execute_query(
+                        "SELECT id, password, note FROM passwords WHERE id > ? "
+                        "AND (typeof(password) = 'text' OR typeof(note) = 'text') ORDER BY id LIMIT ?",
+                        (after_id, batch_size),
+                    )
+                    if not rows:
+                        break
+                    self._rewrite_secrets(connection, rows, self.cipher)
+                total += len(rows)
+                after_id = rows[-1][0]
+                if progress_callback is not None:
+                    progress_callback(total)
+            self.purge_search_index()
+        finally:
+            connection.execute("PRAGMA secure_delete = OFF")
+        # переносим изменения из wal в базу и обрезаем журнал, где остались старые страницы
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return total
+
+    def purge_search_index(self):
+        """выбрасывает из fts-индекса удаленные термы, вызывается при включенном secure_delete
+
+        триггер обновления только дописывает в индекс метки удаления, а сегменты
+        с триграммами старых открытых заметок остаются в passwords_fts_data до слияния.
+        'optimize' сливает все сегменты в один без удаленных записей"""
+        if not self.fts_enabled:
+            return
+        connection = self.connection
+        with self.transaction():
+            connection.execute("INSERT INTO passwords_fts (passwords_fts) VALUES ('optimize')")
+        # после слияния словарь индекса совпадает с данными на диске: если открытых
+        # заметок не осталось, в нем не должно быть ни одного терма колонки note
+        connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS temp.passwords_fts_vocab "
+            "USING fts5vocab('main', 'passwords_fts', 'col')"
+        )
+        leaked = connection.execute(
+            "SELECT EXISTS (SELECT 1 FROM temp.passwords_fts_vocab WHERE col = 'note') "
+            "AND NOT EXISTS (SELECT 1 FROM passwords WHERE typeof(note) = 'text' AND note != '')"
+        ).fetchone()[0]
+        if leaked:
+            raise DatabaseError("В поисковом индексе остались слова из открытых заметок.")
+
+    def change_master_password(self, new_master_password, batch_size=1000, progress_callback=None):
+        """перешифровывает всё хранилище новым ключом одной транзакцией
+
+        пачки читаются по ключу, но фиксируются вместе: записи со старым и новым
+        ключом не смешиваются даже при сбое посередине"""
+        old = self.cipher
+        if old is None:
+            raise DatabaseError("Хранилище не зашифровано.")
+        if old.locked:
+            raise VaultLockedError()
+        new = VaultCipher.create(new_master_password, old.n, old.r, old.p, old.idle_timeout)
+        connection = self.connection
+        total = 0
+        after_id = 0
+        with self.transaction():
+            while True:
+                rows = self.execute_query(
+                    "SELECT id, password, note FROM passwords WHERE id > ? ORDER BY id LIMIT ?",
+                    (after_id, batch_size),
+                )
+                if not rows:
+                    break
+                self._rewrite_secrets(connection, rows, new)
+                total += len(rows)
+                after_id = rows[-1][0]
+                if progress_callback is not None:
+                    progress_callback(total)
+            self.set_meta("kdf_salt", new.salt)
+            self.set_meta("kdf_params", new.params)
+            self.set_meta("kdf_verifier", new.verifier())
+        self.cipher = new
+        self.fingerprint_key = new.subkey(b"fingerprint")
+        return total
+
+    def _rewrite_secrets(self, connection, rows, cipher):
+        """переписывает пароли, заметки и отпечатки ключом cipher, вызывается внутри транзакции
+
+        rows - (id, password, note) в том виде, в каком они лежат в базе"""
+        fingerprint_key = cipher.subkey(b"fingerprint")
+        updates = []
+        for password_id, password, note in rows:
+            password = self.reveal(password, "password", password_id)
+            note = self.reveal(note, "note", password_id)
+            updates.append((
+                cipher.encrypt(password, "password", password_id),
+                None if note is None else cipher.encrypt(note, "note", password_id),
+                self._fingerprint(fingerprint_key, password),
+                password_id,
+            ))
+        try:
+            # триггер обновит updated_at, и другие окна перечитают шифротексты
+            connection.executemany(
+                "UPDATE passwords SET password = ?, note = ?, fingerprint = ? WHERE id = ?", updates
+            )
+        except sqlite3.Error as e:
+            raise DatabaseError(str(e)) from e
+
+    def load_fingerprint_key(self):
+        """читает ключ отпечатков паролей, при первом запуске создает его"""
+        if self.cipher is not None:
+            # у зашифрованного хранилища ключ отпечатков выводится из мастер-пароля
+            self.fingerprint_key = None if self.cipher.locked else self.cipher.subkey(b"fingerprint")
+            return
+        # INSERT OR IGNORE не даст двум процессам записать разные ключи
+        self.connection.execute(
+            "INSERT OR IGNORE INTO vault_meta (key, value) VALUES ('fingerprint_key', ?)",
+            (os.urandom(32),),
+        )
+        self.fingerprint_key = self.get_meta("fingerprint_key")
+
+    def fingerprint(self, password):
+        """ключевой хэш пароля: одинаковые пароли дают одинаковый отпечаток, сам пароль не раскрывается"""
+        if self.locked or self.fingerprint_key is None:
+            raise VaultLockedError()
+        return self._fingerprint(self.fingerprint_key, password)
+
+    @staticmethod
+    def _fingerprint(key, password):
+        # однократный hmac.digest идет быстрым путем openssl, без объекта hmac на каждую строку
+        return hmac.digest(key, password.encode("utf-8"), "sha256")[:16]
+
+    def create_search_index(self):
+        """создает полнотекстовый trigram-индекс и триггеры синхронизации с таблицей passwords
+
+        если sqlite собран без fts5, триггеры удаляются и поиск идет через LIKE"""
+        connection = self.connection
+        try:
+            connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS passwords_fts USING fts5("
+                "name, username, note, content='passwords', content_rowid='id', "
+                "tokenize='trigram')"
+            )
+        except sqlite3.OperationalError:
+            self.fts_enabled = False
+            # без модуля fts5 триггеры ломают любую вставку, поэтому убираем их
+            for trigger in FTS_TRIGGERS:
+                connection.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            return
+
+        self.fts_enabled = True
+        existing = {
+            row[0] for row in connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'passwords'"
+            )
+        }
+        if existing.issuperset(FTS_TRIGGERS):
+            return
+        # индекс новый или триггеры пропали - пересоздаем их и перестраиваем индекс целиком
+        with self.transaction():
+            self._create_fts_triggers(connection)
+            # 'rebuild' читал бы заметки из таблицы как есть, вместе с шифротекстами
+            connection.execute("INSERT INTO passwords_fts (passwords_fts) VALUES ('delete-all')")
+            connection.execute(
+                "INSERT INTO passwords_fts (rowid, name, username, note) "
+                f"SELECT id, name, username, {FTS_NOTE.format(row='passwords')} FROM passwords"
+            )
+
+    @staticmethod
+    def _create_fts_triggers(connection):
+        """создает недостающие триггеры синхронизации fts-индекса"""
+        new_note, old_note = FTS_NOTE.format(row="new"), FTS_NOTE.format(row="old")
+        connection.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS passwords_fts_insert AFTER INSERT ON passwords BEGIN
+            INSERT INTO passwords_fts (rowid, name, username, note)
+            VALUES (new.id, new.name, new.username, {new_note});
+        END
+        """)
+        connection.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS passwords_fts_delete AFTER DELETE ON passwords BEGIN
+            INSERT INTO passwords_fts (passwords_fts, rowid, name, username, note)
+            VALUES ('delete', old.id, old.name, old.username, {old_note});
+        END
+        """)
+        connection.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS passwords_fts_update
+        AFTER UPDATE OF name, username, note ON passwords BEGIN
+            INSERT INTO passwords_fts (passwords_fts, rowid, name, username, note)
+            VALUES ('delete', old.id, old.name, old.username, {old_note});
+            INSERT INTO passwords_fts (rowid, name, username, note)
+            VALUES (new.id, new.name, new.username, {new_note});
+        END
+        """)
+
+    @contextmanager
+    def _fts_triggers_suspended(self, connection, enabled=True):
+        """снимает триггеры вставки и обновления fts на время пачки, вызывается внутри транзакции
+
+        индекс вызывающий обновляет сам через _sync_fts. DDL входит в транзакцию: другие
+        соединения не видят базу без триггеров, а откат вернет их вместе с данными"""
+        if not (enabled and self.fts_enabled):
+            yield
+            return
+        try:
+            connection.execute("DROP TRIGGER IF EXISTS passwords_fts_insert")
+            connection.execute("DROP TRIGGER IF EXISTS passwords_fts_update")
+            yield
+            self._create_fts_triggers(connection)
+        except sqlite3.Error as e:
+            raise DatabaseError(str(e)) from e
+
+    def _sync_fts(self, connection, password_ids, delete=False):
+        """добавляет строки в fts-индекс или, при delete=True, убирает их текущие значения
+
+        по одному запросу на 900 id вместо триггера на каждую строку"""
+        command = "'delete', " if delete else ""
+        target = "passwords_fts (passwords_fts, rowid, name, username, note)" if delete else \
+            "passwords_fts (rowid, name, username, note)"
+        password_ids = list(password_ids)
+        for start in range(0, len(password_ids), 900):
+            part = password_ids[start:start + 900]
+            placeholders = ", ".join("?" * len(part))
+            self._execute_many(connection, (
+                f"INSERT INTO {target} SELECT {command}id, name, username, "
+                f"{FTS_NOTE.format(row='passwords')} FROM passwords WHERE id IN ({placeholders})"
+            ), [part])
 
     def execute_query(self, query, params=None):
         """выполняет sql-запросы"""
         if params is None:
             params = ()
         try:
-            connection = sqlite3.connect(self.db_name)
-            cursor = connection.cursor()
-            cursor.execute(query, params)
+            if self.instrumentation is None:
+                return self.connection.execute(query, params).fetchall()
+            start = time.perf_counter()
+            cursor = self.connection.execute(query, params)
             result = cursor.fetchall()
-            connection.commit()
-            connection.close()
-            # debug log
-            print(f"Выполнен запрос: {query} с параметрами: {params}")
+            self.instrumentation.record(
+                query, time.perf_counter() - start, len(result) or cursor.rowcount, len(params)
+            )
             return result
         except sqlite3.Error as e:
-            print(f"Ошибка базы данных: {e}")
+            # внутри транзакции ошибку нельзя проглотить, иначе зафиксируется часть изменений
+            if self.in_transaction:
+                raise DatabaseError(str(e)) from e
+            # запрос прервал interruptible: результат всё равно не нужен, в журнал не пишем
+            if not getattr(self._local, "interrupted", False):
+                _log_error("Ошибка базы данных: %s", e)
             return []
         except Exception as e:
-            print(f"Общая ошибка: {e}")
+            if self.in_transaction:
+                raise
+            _log_error("Общая ошибка: %s", e)
             return []
 
-    def get_passwords(self, filter_text=""):
-        """возвращает пароли с фильтрацией по тексту"""
+    def iter_query(self, query, params=None, batch_size=1000):
+        """выполняет запрос и отдает строки пачками через fetchmany, не загружая весь результат"""
+        if params is None:
+            params = ()
+        # отдельный курсор, чтобы другие запросы не сбросили выборку
+        cursor = self.connection.cursor()
+        # время считаем только внутри sqlite, без обработки строк потребителем
+        elapsed = 0.0
+        row_count = 0
+        try:
+            start = time.perf_counter()
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                elapsed += time.perf_counter() - start
+                if not rows:
+                    break
+                row_count += len(rows)
+                yield from rows
+                start = time.perf_counter()
+        except sqlite3.Error as e:
+            raise DatabaseError(str(e)) from e
+        finally:
+            cursor.close()
+            if self.instrumentation is not None:
+                self.instrumentation.record(query, elapsed, row_count, len(params))
+
+    def get_passwords(self, filter_text="", limit=None, offset=0):
+        """возвращает пароли с фильтрацией по тексту, limit/offset задают страницу"""
+        if self._can_use_fts(filter_text):
+            # ищем только по названию и логину, как и раньше
+            return self._search_fts("{name username} : " + self._fts_phrase(filter_text), limit, offset)
         query = "SELECT * FROM passwords"
+        params = ()
         if filter_text:
             query += " WHERE name LIKE ? OR username LIKE ?"
-            return self.execute_query(query, ('%' + filter_text + '%', '%' + filter_text + '%'))
-        return self.execute_query(query)
+            params = ('%' + filter_text + '%', '%' + filter_text + '%')
+        query += " ORDER BY id"
+        return self.execute_query(*self._paginate(query, params, limit, offset))
+
+    def get_passwords_page(self, filter_text="", sort_column="id", descending=False, after_key=None,
+                           limit=200):
+        """возвращает страницу паролей, отсортированную по sort_column (id, name или username)
+
+        страницы листаются по ключу (keyset): after_key - ключ последней строки
+        предыдущей страницы из page_key, None - первая страница. запрос продолжает
+        обход индекса с этого ключа, поэтому любая страница стоит одинаково, а OFFSET
+        заставил бы sqlite перебрать все строки до неё"""
+        if sort_column not in SORT_COLUMNS:
+            raise ValueError(f"Сортировка по колонке {sort_column!r} не поддерживается.")
+        direction = "DESC" if descending else "ASC"
+        conditions = []
+        params = ()
+        if self._can_use_fts(filter_text):
+            conditions.append("id IN (SELECT rowid FROM passwords_fts WHERE passwords_fts MATCH ?)")
+            params += ("{name username} : " + self._fts_phrase(filter_text),)
+        elif filter_text:
+            conditions.append("(name LIKE ? OR username LIKE ?)")
+            params += ('%' + filter_text + '%', '%' + filter_text + '%')
+        if after_key is not None:
+            operator = "<" if descending else ">"
+            if sort_column == "id":
+                conditions.append(f"id {operator} ?")
+                params += (after_key[-1],)
+            else:
+                # сравнение пар (значение, id) совпадает с порядком индекса по колонке
+                conditions.append(f"({sort_column}, id) {operator} (?, ?)")
+                params += tuple(after_key)
+        query = "SELECT * FROM passwords"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        if sort_column == "id":
+            query += f" ORDER BY id {direction}"
+        else:
+            query += f" ORDER BY {sort_column} {direction}, id {direction}"
+        return self.execute_query(query + " LIMIT ?", params + (limit,))
+
+    @staticmethod
+    def page_key(row, sort_column="id"):
+        """ключ строки для after_key следующей страницы"""
+        return (row[SORT_COLUMNS[sort_column]], row[0])
+
+    def search_passwords(self, text, limit=None):
+        """ищет подстроку в названии, логине и заметке, лучшие совпадения идут первыми"""
+        if not text:
+            return []
+        if self._can_use_fts(text):
+            return self._search_fts(self._fts_phrase(text), limit)
+        query = "SELECT * FROM passwords WHERE name LIKE ? OR username LIKE ? OR note LIKE ? ORDER BY id"
+        pattern = '%' + text + '%'
+        return self.execute_query(*self._paginate(query, (pattern, pattern, pattern), limit))
+
+    @staticmethod
+    def _paginate(query, params, limit=None, offset=0):
+        """добавляет к запросу LIMIT/OFFSET, если задан размер страницы"""
+        if limit is None:
+            return query, params
+        return query + " LIMIT ? OFFSET ?", params + (limit, offset)
+
+    def _can_use_fts(self, text):
+        """trigram-индекс работает только для строк от трех символов"""
+        return self.fts_enabled and len(text) >= 3
+
+    @staticmethod
+    def _fts_phrase(text):
+        """экранирует текст как фразу fts5, чтобы спецсимволы не считались синтаксисом"""
+        return '"' + text.replace('"', '""') + '"'
+
+    def _search_fts(self, match, limit=None, offset=0):
+        """выполняет запрос к fts-индексу и возвращает строки passwords по рангу"""
+        query = (
+            "SELECT p.* FROM (SELECT rowid, rank FROM passwords_fts WHERE passwords_fts MATCH ?) AS f "
+            "JOIN passwords AS p ON p.id = f.rowid ORDER BY f.rank, p.id"
+        )
+        return self.execute_query(*self._paginate(query, (match,), limit, offset))
 
     def add_password(self, name, username, password, note=""):
-        """добавляет новый пароль в базу данных"""
-        query = "INSERT INTO passwords (name, username, password, note) VALUES (?, ?, ?, ?)"
-        # debug log
-        print(f"Добавление пароля с: {name}, {username}, {password}, {note}")
-        self.execute_query(query, (name, username, password, note))
+        """добавляет новый пароль в базу данных и возвращает его id, при ошибке базы - None"""
+        fingerprint = self.fingerprint(password)
+        nested = self.in_transaction
+        try:
+            with self.transaction() as connection:
+                [password_id] = self._insert_chunk(connection, [(name, username, password, note, fingerprint)])
+        except DatabaseError as e:
+            # внутри чужой транзакции ошибку нельзя проглотить, как и в execute_query
+            if nested:
+                raise
+            _log_error("Ошибка базы данных: %s", e)
+            return None
+        return password_id
+
+    def get_password_by_id(self, password_id):
+        """возвращает запись по id или None"""
+        result = self.execute_query("SELECT * FROM passwords WHERE id = ?", (password_id,))
+        return result[0] if result else None
+
+    def add_passwords_bulk(self, rows, chunk_size=1000, dedup=False, progress_callback=None):
+        """добавляет много паролей из итерируемого источника, одна транзакция на пачку строк
+
+        rows - любые итерируемые кортежи (name, username, password, note), в том числе генератор.
+        при dedup=True записи с одинаковыми (name, username) не дублируются, а обновляются.
+        исключение из rows откатывает только текущую пачку, уже зафиксированные остаются.
+        progress_callback(total) вызывается после фиксации каждой пачки.
+        возвращает количество обработанных строк"""
+        fingerprint = self.fingerprint
+        rows = ((name, username, password, note, fingerprint(password)) for name, username, password, note in rows)
+        total = 0
+        while True:
+            # пачка читается внутри транзакции: ошибка источника откатывает только её
+            with self.transaction() as connection:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                # построчные триггеры fts занимали большую часть времени импорта
+                bulk_fts = self.fts_enabled and len(chunk) >= FTS_BULK_ROWS
+                with self._fts_triggers_suspended(connection, bulk_fts):
+                    if dedup:
+                        self._upsert_chunk(connection, chunk, bulk_fts)
+                    else:
+                        self._insert_chunk(connection, chunk, bulk_fts)
+            total += len(chunk)
+            if progress_callback is not None:
+                progress_callback(total)
+        return total
+
+    def _insert_chunk(self, connection, chunk, sync_fts=False):
+        """вставляет строки (name, username, password, note, fingerprint), вызывается внутри транзакции
+
+        шифротекст привязан к id записи, поэтому id выдаются до вставки: под блокировкой
+        записи строки никто больше не вставит, и новые id идут подряд за наибольшим.
+        sync_fts - триггеры fts сняты, и индекс нужно дополнить здесь. возвращает выданные id"""
+        try:
+            first_id = connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM passwords").fetchone()[0]
+        except sqlite3.Error as e:
+            raise DatabaseError(str(e)) from e
+        seal = self.seal
+        rows = [(password_id, name, username, seal(password, "password", password_id),
+                 seal(note, "note", password_id), fingerprint)
+                for password_id, (name, username, password, note, fingerprint) in enumerate(chunk, first_id)]
+        self._execute_many(connection, INSERT_ROW, rows)
+        password_ids = range(first_id, first_id + len(rows))
+        if sync_fts:
+            self._sync_fts(connection, password_ids)
+        return password_ids
+
+    def _upsert_chunk(self, connection, chunk, sync_fts=False):
+        """вставляет новые ключи пачки и обновляет записи с уже существующими (name, username)
+
+        уникального ограничения на ключ нет, поэтому существующие ключи ищутся запросом.
+        из повторов ключа внутри пачки побеждает последний, как при построчной вставке"""
+        latest = {}
+        for row in chunk:
+            latest[row[:2]] = row
+        keys = list(latest)
+        existing = {}
+        # не больше 999 параметров в запросе, по два на ключ
+        for start in range(0, len(keys), 450):
+            part = keys[start:start + 450]
+            values = ", ".join("(?, ?)" for _ in part)
+            params = [value for key in part for value in key]
+            try:
+                matches = connection.execute(
+                    # соединение с VALUES идет по индексу названия, IN по паре колонок читал бы всю таблицу
+                    "SELECT p.id, p.name, p.username FROM (VALUES "
+                    f"{values}) AS k JOIN passwords AS p ON p.name = k.column1 AND p.username = k.column2",
+                    params,
+                ).fetchall()
+            except sqlite3.Error as e:
+                raise DatabaseError(str(e)) from e
+            for password_id, name, username in matches:
+                existing.setdefault((name, username), []).append(password_id)
+        # каждая запись с ключом получает свой шифротекст, привязанный к её id
+        seal = self.seal
+        updates = [(seal(password, "password", password_id), seal(note, "note", password_id), fp, password_id)
+                   for key, (_, _, password, note, fp) in latest.items()
+                   for password_id in existing.get(key, ())]
+        inserts = [row for key, row in latest.items() if key not in existing]
+        if updates:
+            updated_ids = [update[-1] for update in updates]
+            if sync_fts:
+                # внешний индекс удаляет запись только по её старым значениям
+                self._sync_fts(connection, updated_ids, delete=True)
+            self._execute_many(connection, UPSERT_UPDATE, updates)
+            if sync_fts:
+                self._sync_fts(connection, updated_ids)
+        if inserts:
+            self._insert_chunk(connection, inserts, sync_fts)
+
+    def _execute_many(self, connection, query, rows):
+        start = time.perf_counter()
+        try:
+            connection.executemany(query, rows)
+        except sqlite3.Error as e:
+            raise DatabaseError(str(e)) from e
+        if self.instrumentation is not None:
+            self.instrumentation.record(query, time.perf_counter() - start, len(rows), len(rows[0]))
+
+    def backup(self, target_path, pages=1024, progress_callback=None, sleep=0.005, verify=True):
+        """делает снимок базы через online backup api sqlite
+
+        страницы копируются шагами по pages штук из отдельного соединения, другие соединения
+        в это время могут продолжать писать. progress_callback(copied, total)
+        вызывается после каждого шага, verify проверяет целостность копии"""
+        source = sqlite3.connect(self.db_name, timeout=self.busy_timeout / 1000)
+        target = sqlite3.connect(target_path)
+        try:
+            if source.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+                # в режиме WAL читающая транзакция закрепляет снимок и не мешает писателям,
+                # иначе каждая чужая запись между шагами перезапускала бы копирование
+                source.execute("BEGIN")
+                source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            source.backup(
+                target, pages=pages, progress=self._backup_progress(progress_callback), sleep=sleep
+            )
+            if source.in_transaction:
+                source.execute("COMMIT")
+            if verify:
+                self.verify_integrity(target)
+        except sqlite3.Error as e:
+            raise DatabaseError(str(e)) from e
+        finally:
+            target.close()
+            source.close()
+
+    def vacuum_into(self, target_path, verify=True):
+        """делает сжатый снимок базы через VACUUM INTO, файл назначения не должен существовать"""
+        try:
+            self.connection.execute("VACUUM INTO ?", (target_path,))
+        except sqlite3.Error as e:
+            raise DatabaseError(str(e)) from e
+        if verify:
+            target = sqlite3.connect(target_path)
+            try:
+                self.verify_integrity(target)
+            finally:
+                target.close()
+
+    def restore(self, source_path, pages=1024, progress_callback=None, sleep=0.005):
+        """заменяет содержимое базы снимком, предварительно проверив его целостность"""
+        source = sqlite3.connect(source_path)
+        try:
+            self.verify_integrity(source)
+            source.backup(
+                self.connection, pages=pages, progress=self._backup_progress(progress_callback),
+                sleep=sleep,
+            )
+        except sqlite3.Error as e:
+            raise DatabaseError(str(e)) from e
+        finally:
+            source.close()
+        # снимок мог быть сделан старой версией программы
+        self.create_table()
+
+    @staticmethod
+    def verify_integrity(connection):
+        """проверяет целостность базы, при повреждении выбрасывает DatabaseError"""
+        result = [row[0] for row in connection.execute("PRAGMA integrity_check")]
+        if result != ["ok"]:
+            raise DatabaseError("проверка целостности не пройдена: " + "; ".join(result[:5]))
+
+    @staticmethod
+    def _backup_progress(progress_callback):
+        if progress_callback is None:
+            return None
+        return lambda status, remaining, total: progress_callback(total - remaining, total)
+
+    @staticmethod
+    def vault_file_encrypted(path):
+        """True, если файл базы паролей зашифрован мастер-паролем"""
+        connection = sqlite3.connect(path)
+        try:
+            return connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'vault_meta' "
+                "AND EXISTS (SELECT 1 FROM vault_meta WHERE key = 'kdf_salt')"
+            ).fetchone() is not None
+        except sqlite3.Error as e:
+            raise DatabaseError(str(e)) from e
+        finally:
+            connection.close()
+
+    def merge_from(self, path, policy="newest", dry_run=False, master_password=None, sample=100):
+        """вливает в хранилище записи другой базы паролей, сопоставляя их по (name, username)
+
+        policy решает спор, когда у записей с одним ключом разные пароль или заметка:
+        newest - побеждает запись, измененная позже, local - остается своя, both - сохраняются обе.
+        из нескольких записей другой базы с одним ключом берется самая новая.
+        база подключается через ATTACH, сопоставление и запись идут запросами над
+        целыми таблицами в одной транзакции. строки проходят через python, только если
+        нужно расшифровать или зашифровать значения. master_password - пароль другой
+        базы, если она зашифрована своим ключом. dry_run только считает изменения.
+        возвращает отчет: счетчики и до sample конфликтов (name, username, решение)"""
+        if policy not in MERGE_POLICIES:
+            raise ValueError(f"неизвестная политика объединения: {policy!r}")
+        if not os.path.exists(path):
+            # ATTACH несуществующего файла молча создал бы пустую базу
+            raise DatabaseError(f"Файл базы не найден: {path}")
+        if os.path.exists(self.db_name) and os.path.samefile(path, self.db_name):
+            raise DatabaseError("Нельзя объединить базу саму с собой.")
+        if self.in_transaction:
+            raise DatabaseError("Объединение нельзя выполнять внутри транзакции.")
+        if self.locked:
+            raise VaultLockedError()
+
+        connection = self.connection
+        try:
+            connection.execute("ATTACH DATABASE ? AS merge_source", (path,))
+        except sqlite3.Error as e:
+            raise DatabaseError(str(e)) from e
+        try:
+            with self.transaction():
+                columns = self._merge_columns(connection, master_password)
+                self._plan_merge(policy, columns)
+                report = self._merge_report(sample)
+                report["dry_run"] = dry_run
+                if not dry_run:
+                    self._apply_merge(columns)
+                self.execute_query("DROP TABLE temp.merge_plan")
+        finally:
+            connection.execute("DETACH DATABASE merge_source")
+        return report
+
+    def _merge_columns(self, connection, master_password):
+        """sql-выражения для колонок другой базы с учетом её версии схемы и шифрования"""
+        source_columns = {row[1] for row in self.execute_query("PRAGMA merge_source.table_info(passwords)")}
+        if not source_columns:
+            raise DatabaseError("В выбранном файле нет таблицы паролей.")
+        meta = {}
+        if self.execute_query("SELECT 1 FROM merge_source.sqlite_master WHERE name = 'vault_meta'"):
+            meta = dict(self.execute_query("SELECT key, value FROM merge_source.vault_meta"))
+        source_salt = meta.get("kdf_salt")
+        columns = {
+            # старые базы без колонок времени считаются измененными в EPOCH, как при миграции
+            "created_at": "s.created_at" if "created_at" in source_columns else f"'{EPOCH}'",
+            "updated_at": "s.updated_at" if "updated_at" in source_columns else f"'{EPOCH}'",
+            "strength": "s.strength" if "strength" in source_columns else "NULL",
+            "password": "s.password",
+            "note": "s.note",
+            "same": "s.password = l.password AND s.note IS l.note",
+        }
+        if source_salt is None and self.cipher is None:
+            return columns
+
+        if source_salt is None:
+            source_cipher = None
+        elif self.cipher is not None and source_salt == self.cipher.salt:
+            # копия этого же хранилища: ключ уже есть, мастер-пароль не нужен
+            source_cipher = self.cipher
+        else:
+            if master_password is None:
+                raise VaultLockedError("выбранная база зашифрована, введите её мастер-пароль")
+            source_cipher = VaultCipher.from_params(source_salt, meta.get("kdf_params"))
+            source_cipher.unlock(master_password, meta.get("kdf_verifier"))
+
+        def reveal_source(value, column, password_id):
+            if not isinstance(value, bytes):
+                return value
+            return source_cipher.decrypt(value, column, password_id)
+
+        connection.create_function("merge_reveal_source", 3, reveal_source, deterministic=True)
+        connection.create_function("merge_reveal_local", 3, self.reveal, deterministic=True)
+        connection.create_function(
+            "merge_seal", 4,
+            lambda value, column, source_id, password_id: self.seal(
+                reveal_source(value, column, source_id), column, password_id),
+        )
+        # шифротексты одного значения различаются, поэтому сравниваем открытый текст
+        columns["same"] = (
+            "merge_reveal_source(s.password, 'password', s.id) = merge_reveal_local(l.password, 'password', l.id) "
+            "AND merge_reveal_source(s.note, 'note', s.id) IS merge_reveal_local(l.note, 'note', l.id)"
+        )
+        # шифротекст привязан к id записи, поэтому переносится только через расшифровку;
+        # {id} - id записи в этой базе, его подставляет _apply_merge
+        columns["password"] = "merge_seal(s.password, 'password', s.id, {id})"
+        columns["note"] = "merge_seal(s.note, 'note', s.id, {id})"
+        return columns
+
+    def _plan_merge(self, policy, columns):
+        """раскладывает записи другой базы по действиям во временной таблице merge_plan
+
+        add - новый ключ, same - такая же запись уже есть, update - заменить свою запись,
+        copy - добавить рядом со своей, keep - оставить свою"""
+        self.execute_query("DROP TABLE IF EXISTS temp.merge_plan")
+        self.execute_query(
+            "CREATE TEMP TABLE merge_plan (source_id INTEGER PRIMARY KEY, local_id INTEGER, action TEXT NOT NULL)"
+        )
+        # своя запись для сравнения - самая новая с тем же ключом, её ищет индекс по названию
+        self.execute_query(f"""
+        INSERT INTO temp.merge_plan (source_id, local_id, action)
+        SELECT s.id, l.id, CASE
+            WHEN l.id IS NULL THEN 'add'
+            WHEN {columns["same"]} THEN 'same'
+            WHEN :policy = 'both' THEN 'copy'
+            WHEN :policy = 'newest' AND {columns["updated_at"]} > l.updated_at THEN 'update'
+            ELSE 'keep'
+        END
+        FROM (
+            SELECT s.id, row_number() OVER (
+                PARTITION BY s.name, s.username ORDER BY {columns["updated_at"]} DESC, s.id DESC
+            ) AS position
+            FROM merge_source.passwords AS s
+        ) AS newest
+        JOIN merge_source.passwords AS s ON s.id = newest.id
+        LEFT JOIN main.passwords AS l ON l.id = (
+            SELECT id FROM main.passwords WHERE name = s.name AND username = s.username
+            ORDER BY updated_at DESC, id DESC LIMIT 1
+        )
+        WHERE newest.position = 1
+        """, {"policy": policy})
+
+    def _merge_report(self, sample):
+        counts = dict(self.execute_query("SELECT action, COUNT(*) FROM temp.merge_plan GROUP BY action"))
+        conflicts = self.execute_query(
+            "SELECT s.name, s.username, p.action FROM temp.merge_plan AS p "
+            "JOIN merge_source.passwords AS s ON s.id = p.source_id "
+            "WHERE p.action IN ('update', 'copy', 'keep') ORDER BY s.name, s.username LIMIT ?",
+            (sample,),
+        )
+        return {
+            "added": counts.get("add", 0),
+            "updated": counts.get("update", 0),
+            "kept_both": counts.get("copy", 0),
+            "kept_local": counts.get("keep", 0),
+            "unchanged": counts.get("same", 0),
+            "conflicts": conflicts,
+        }
+
+    def _apply_merge(self, columns):
+        """выполняет план merge_plan, вызывается внутри транзакции"""
+        # отпечатки сбрасываются: у другой базы свой ключ отпечатков, update_fingerprints
+        # досчитает их при аудите. updated_at обновит триггер: запись изменилась сейчас,
+        # и другие окна увидят замену
+        self.execute_query(f"""
+        UPDATE main.passwords
+        SET password = {columns["password"].format(id="p.local_id")}, note = {columns["note"].format(id="p.local_id")},
+            strength = {columns["strength"]}, fingerprint = NULL
+        FROM temp.merge_plan AS p JOIN merge_source.passwords AS s ON s.id = p.source_id
+        WHERE p.action = 'update' AND passwords.id = p.local_id
+        """)
+        # новые записи сохраняют время создания и изменения из другой базы. id выдаются
+        # заранее, как в _insert_chunk: к ним привязаны шифротексты
+        first_id = self.execute_query("SELECT COALESCE(MAX(id), 0) + 1 FROM main.passwords")[0][0]
+        self.execute_query(f"""
+        INSERT INTO main.passwords (id, name, username, password, note, strength, created_at, updated_at)
+        SELECT n.id, s.name, s.username, {columns["password"].format(id="n.id")},
+            {columns["note"].format(id="n.id")}, {columns["strength"]},
+            {columns["created_at"]}, {columns["updated_at"]}
+        FROM (
+            SELECT source_id, :first_id + row_number() OVER (ORDER BY source_id) - 1 AS id
+            FROM temp.merge_plan WHERE action IN ('add', 'copy')
+        ) AS n
+        JOIN merge_source.passwords AS s ON s.id = n.source_id
+        ORDER BY n.id
+        """, {"first_id": first_id})
 
     def delete_password(self, password_id):
         """удаляет пароль из базы данных по id"""
         query = "DELETE FROM passwords WHERE id = ?"
         self.execute_query(query, (password_id,))
 
+    def delete_passwords(self, password_ids, chunk_size=900):
+        """удаляет записи по списку id одной транзакцией, возвращает id действительно удаленных
+
+        id передаются пачками по chunk_size: старые сборки sqlite принимают
+        не больше 999 параметров в запросе"""
+        password_ids = list(password_ids)
+        deleted = []
+        with self.transaction():
+            for start in range(0, len(password_ids), chunk_size):
+                chunk = password_ids[start:start + chunk_size]
+                placeholders = ", ".join("?" * len(chunk))
+                result = self.execute_query(
+                    f"DELETE FROM passwords WHERE id IN ({placeholders}) RETURNING id", tuple(chunk)
+                )
+                deleted.extend(row[0] for row in result)
+        return deleted
+
+    def data_version(self):
+        """счетчик PRAGMA data_version соединения этого потока
+
+        меняется, когда изменения в базе зафиксировало другое соединение,
+        в том числе другой процесс; проверка не читает таблицы и стоит микросекунды"""
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def get_change_marker(self):
+        """отметка для get_changes_since: последнее время изменения и наибольший id"""
+        row = self.connection.execute(
+            "SELECT (SELECT max(updated_at) FROM passwords), "
+            "(SELECT max(deleted_at) FROM deleted_passwords), (SELECT max(id) FROM passwords)"
+        ).fetchone()
+        return max(row[0] or EPOCH, row[1] or EPOCH), row[2] or 0
+
+    def get_changes_since(self, marker):
+        """строки, измененные или добавленные после отметки, и id удаленных записей
+
+        возвращает (строки, id удаленных, новая отметка). время сравнивается через >=,
+        поэтому изменения из той же миллисекунды не теряются, а повтор безвреден.
+        новые строки дополнительно ищутся по id: пачка, записанная долгой транзакцией,
+        получает время начала записи и может оказаться старше уже виденной отметки"""
+        since, max_id = marker
+        # iter_query не глотает ошибки: при сбое отметка не должна сдвинуться
+        rows = list(self.iter_query(
+            # обе ветки идут по индексам: по updated_at и по первичному ключу
+            "SELECT * FROM passwords WHERE id IN (SELECT id FROM passwords WHERE updated_at >= ? "
+            "UNION ALL SELECT id FROM passwords WHERE id > ?) ORDER BY id",
+            (since, max_id),
+        ))
+        # журнал удалений читается вторым: запись, удаленная между запросами, не вернется в таблицу
+        deleted = list(self.iter_query(
+            "SELECT id, deleted_at FROM deleted_passwords WHERE deleted_at >= ?", (since,)
+        ))
+        deleted_ids = {row[0] for row in deleted}
+        updated_at = max((row[UPDATED_AT_COLUMN] for row in rows), default=since)
+        deleted_at = max((row[1] for row in deleted), default=since)
+        new_marker = (max(updated_at, deleted_at), max([max_id] + [row[0] for row in rows]))
+        rows = [row for row in rows if row[0] not in deleted_ids]
+        return rows, sorted(deleted_ids), new_marker
+
+    def prune_tombstones(self, days=7):
+        """забывает старые отметки об удалении: окна опрашивают базу каждые несколько секунд"""
+        self.execute_query(
+            "DELETE FROM deleted_passwords WHERE deleted_at < strftime('%Y-%m-%d %H:%M:%f', 'now', ?)",
+            (f"-{int(days)} days",),
+        )
+
     def get_all_passwords(self):
         """получает все пароли"""
         query = "SELECT * FROM passwords"
         return self.execute_query(query)
+
+    def update_fingerprints(self):
+        """досчитывает отпечатки для строк без них (старые базы, измененные пароли)"""
+        connection = self.connection
+        connection.create_function(
+            "vault_fingerprint", 2,
+            lambda password_id, password: self.fingerprint(self.reveal(password, "password", password_id)),
+            deterministic=True,
+        )
+        with self.transaction():
+            connection.execute(
+                "UPDATE passwords SET fingerprint = vault_fingerprint(id, password) WHERE fingerprint IS NULL"
+            )
+
+    def get_reuse_groups(self):
+        """возвращает группы id записей с одинаковыми паролями, самые большие группы первыми"""
+        self.update_fingerprints()
+        query = (
+            "SELECT group_concat(id) FROM passwords WHERE fingerprint IS NOT NULL "
+            "GROUP BY fingerprint HAVING COUNT(*) > 1 ORDER BY COUNT(*) DESC"
+        )
+        return [[int(password_id) for password_id in ids.split(",")]
+                for (ids,) in self.execute_query(query)]
+
+    def get_unscored_passwords(self, after_id=0, limit=5000):
+        """возвращает следующую пачку (id, password) строк без оценки сложности"""
+        query = "SELECT id, password FROM passwords WHERE strength IS NULL AND id > ? ORDER BY id LIMIT ?"
+        return [(password_id, self.reveal(password, "password", password_id))
+                for password_id, password in self.execute_query(query, (after_id, limit))]
+
+    def set_strengths(self, scores):
+        """записывает оценки сложности, scores - пары (strength, id)"""
+        with self.transaction() as connection:
+            connection.executemany("UPDATE passwords SET strength = ? WHERE id = ?", scores)
+
+    def get_strength_distribution(self):
+        """возвращает словарь {оценка: количество записей}"""
+        query = "SELECT strength, COUNT(*) FROM passwords GROUP BY strength"
+        return dict(self.execute_query(query))
+
+    def iter_credentials(self, batch_size=1000):
+        """потоково отдает (id, name, username, password) для проверок всего хранилища"""
+        query = "SELECT id, name, username, password FROM passwords ORDER BY id"
+        reveal = self.reveal
+        return ((password_id, name, username, reveal(password, "password", password_id))
+                for password_id, name, username, password in self.iter_query(query, batch_size=batch_size))
+
+    def iter_names(self, batch_size=1000):
+        """потоково отдает (id, name, username) всех записей, без паролей и заметок"""
+        return self.iter_query("SELECT id, name, username FROM passwords ORDER BY id", batch_size=batch_size)
+
+    def iter_export_rows(self, batch_size=1000):
+        """потоково отдает записи (name, username, password, note) для экспорта, в открытом виде"""
+        query = "SELECT id, name, username, password, note FROM passwords ORDER BY id"
+        reveal = self.reveal
+        return ((name, username, reveal(password, "password", password_id), reveal(note, "note", password_id))
+                for password_id, name, username, password, note in self.iter_query(query, batch_size=batch_size))
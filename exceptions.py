@@ -13,3 +13,24 @@ class PasswordStrengthError(PasswordManagerError):
 
     def __init__(self, message="пароль слишком слабый"):
         super().__init__(message)
+
+
+class ImportCancelled(PasswordManagerError):
+    """исключение для прерванного пользователем импорта"""
+
+    def __init__(self, message="импорт отменен"):
+        super().__init__(message)
+
+
+class VaultLockedError(PasswordManagerError):
+    """исключение для зашифрованного хранилища без введенного мастер-пароля"""
+
+    def __init__(self, message="хранилище заблокировано, введите мастер-пароль"):
+        super().__init__(message)
+
+
+class InvalidMasterPasswordError(PasswordManagerError):
+    """исключение для неверного мастер-пароля"""
+
+    def __init__(self, message="неверный мастер-пароль"):
+        super().__init__(message)
@@ -0,0 +1,45 @@
+# import_pipeline.py
+import os
+
+from csv_handler import CSVHandler
+from exceptions import ImportCancelled
+
+# сколько отклоненных строк хранить в отчете, остальные только считаются
+MAX_REJECTED_DETAILS = 1000
+
+
+def run_import(task, db, file_name, chunk_size=1000, dedup=False):
+    """импорт csv конвейером: потоковое чтение -> проверка строк -> запись пачками
+
+    task - BackgroundTask (или любой объект с cancelled и report): отмена откатывает
+    текущую пачку, прогресс приходит после фиксации каждой пачки.
+    возвращает отчет с числом импортированных строк и отклоненными строками"""
+    total_bytes = os.path.getsize(file_name) or 1
+    summary = {"imported": 0, "rejected": [], "rejected_count": 0, "cancelled": False}
+    position = [0]
+
+    def validated_rows():
+        for line_number, row, bytes_read in CSVHandler.read_records(file_name):
+            if task.cancelled:
+                raise ImportCancelled()
+            position[0] = bytes_read
+            if not row:  # пропускаем пустые строки
+                continue
+            record, reason = CSVHandler.validate_row(row)
+            if record is None:
+                summary["rejected_count"] += 1
+                if len(summary["rejected"]) < MAX_REJECTED_DETAILS:
+                    summary["rejected"].append((line_number, reason))
+                continue
+            yield record
+
+    def chunk_committed(imported):
+        summary["imported"] = imported
+        task.report({"rows": imported, "bytes": position[0], "total_bytes": total_bytes})
+
+    try:
+        db.add_passwords_bulk(validated_rows(), chunk_size=chunk_size, dedup=dedup,
+                              progress_callback=chunk_committed)
+    except ImportCancelled:
+        summary["cancelled"] = True
+    return summary
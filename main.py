@@ -1,32 +1,57 @@
 # main.py
 
+import os
 import sys
-import re
-import csv
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QVBoxLayout, QWidget, QPushButton, QLineEdit,
-    QLabel, QTableWidget, QTableWidgetItem, QHeaderView, QMessageBox, QInputDialog,
-    QHBoxLayout, QFileDialog, QDialog, QCheckBox, QSpinBox, QTextEdit, QProgressBar
+    QLabel, QTableView, QHeaderView, QMessageBox, QInputDialog,
+    QHBoxLayout, QFileDialog, QDialog, QCheckBox, QSpinBox, QTextEdit, QProgressBar,
+    QProgressDialog
 )
+from PyQt6.QtCore import Qt, QThreadPool
+from exceptions import InvalidMasterPasswordError, PasswordManagerError
 from PyQt6.QtGui import QPalette, QColor
 from db_handler import DBHandler
+from csv_handler import CSVHandler
+from password_table_model import PasswordTableModel
+from search_controller import SearchController
+from change_watcher import ChangeWatcher
+from background_task import BackgroundTask
+from vault_cache import VaultCache
+from query_stats import QueryStats
+from strength_audit import StrengthAudit
+from strength_estimator import StrengthEstimator
+from breach_check import BreachCorpus, check_vault
+from import_pipeline import run_import
 from password_generator import PasswordGenerator
 
 
 class PasswordManager(QMainWindow):
-    def __init__(self):
+    def __init__(self, db_name="passwords.db"):
         super().__init__()
-        self.db = DBHandler()
+        # статистика запросов включается переменной окружения с путем к json-отчету
+        self.query_stats_path = os.environ.get("PASSWORD_MANAGER_QUERY_STATS")
+        instrumentation = QueryStats() if self.query_stats_path else None
+        self.db = DBHandler(db_name, instrumentation=instrumentation)
+        # кэш записей между окном и базой данных
+        self.cache = VaultCache(self.db)
         self.password_generator_settings = {
             "length": 12,
             "use_digits": True,
             "use_special_chars": True
         }
         self.show_passwords = False
+        # локальная база утечек, путь можно задать переменной окружения
+        self.breach_corpus = None
+        breach_file = os.environ.get("PASSWORD_MANAGER_BREACH_FILE")
+        if breach_file and os.path.exists(breach_file):
+            self.breach_corpus = BreachCorpus(breach_file)
         self.dark_theme_enabled = False
 
         self.init_ui()
-        
+        # зашифрованное хранилище спрашивает мастер-пароль один раз при запуске
+        if self.db.encrypted:
+            self.ensure_unlocked()
 
     def init_ui(self):
         self.setWindowTitle("Менеджер Паролей")
@@ -37,14 +62,24 @@ class PasswordManager(QMainWindow):
         # поле фильтрации
         self.filter_input = QLineEdit()
         self.filter_input.setPlaceholderText("Фильтровать по названию или имени пользователя")
-        self.filter_input.textChanged.connect(self.load_passwords)
         main_layout.addWidget(self.filter_input)
 
-        # таблица паролей
-        self.table = QTableWidget()
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(["ID", "Имя пользователя", "Пароль", "Заметка"])
+        # таблица паролей, строки подгружаются моделью по мере прокрутки
+        self.model = PasswordTableModel(self.cache, parent=self)
+
+        # фильтрация с задержкой и запросом вне потока интерфейса
+        self.search_controller = SearchController(self.cache, self.model, parent=self)
+        self.filter_input.textChanged.connect(self.search_controller.search)
+        # изменения из других окон и процессов появляются в таблице сами
+        self.change_watcher = ChangeWatcher(self.cache, self.model, parent=self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QTableView.SelectionMode.ExtendedSelection)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        # клик по заголовку сортирует запросом к базе, начальный порядок - по id
+        self.table.horizontalHeader().setSortIndicator(0, Qt.SortOrder.AscendingOrder)
+        self.table.setSortingEnabled(True)
         main_layout.addWidget(self.table)
 
         # панель кнопок
@@ -78,6 +113,30 @@ class PasswordManager(QMainWindow):
         self.import_button.clicked.connect(self.import_passwords)
         button_layout.addWidget(self.import_button)
 
+        self.backup_button = QPushButton("Резервная копия")
+        self.backup_button.clicked.connect(self.backup_vault)
+        button_layout.addWidget(self.backup_button)
+
+        self.restore_button = QPushButton("Восстановить")
+        self.restore_button.clicked.connect(self.restore_vault)
+        button_layout.addWidget(self.restore_button)
+
+        self.merge_button = QPushButton("Объединить базы")
+        self.merge_button.clicked.connect(self.merge_vaults)
+        button_layout.addWidget(self.merge_button)
+
+        self.audit_button = QPushButton("Аудит паролей")
+        self.audit_button.clicked.connect(self.audit_passwords)
+        button_layout.addWidget(self.audit_button)
+
+        self.breach_button = QPushButton("Проверить утечки")
+        self.breach_button.clicked.connect(self.check_breaches)
+        button_layout.addWidget(self.breach_button)
+
+        self.encrypt_button = QPushButton("Шифрование")
+        self.encrypt_button.clicked.connect(self.manage_encryption)
+        button_layout.addWidget(self.encrypt_button)
+
         self.theme_button = QPushButton("Сменить тему")
         self.theme_button.clicked.connect(self.toggle_theme)
         button_layout.addWidget(self.theme_button)
@@ -93,6 +152,7 @@ class PasswordManager(QMainWindow):
         self.setCentralWidget(container)
 
         self.load_passwords()
+        self.change_watcher.start()
 
     def toggle_theme(self):
         palette = QApplication.instance().palette()
@@ -140,6 +200,7 @@ class PasswordManager(QMainWindow):
 - Показать/Скрыть пароли: Переключить видимость паролей.
 - Настройки генератора: Изменить параметры генерации.
 - Экспорт/Импорт: Сохранить или загрузить данные.
+- Объединить базы: Добавить записи из другого файла базы.
 - Сменить тему: Переключить светлую/темную тему.
 """)
         layout.addWidget(help_text)
@@ -147,35 +208,32 @@ class PasswordManager(QMainWindow):
         help_dialog.exec()
 
     def delete_password(self):
-        # получаем индекс выбранной строки
-        selected_row = self.table.currentRow()
-        
-        # проверяем, что строка выбрана (индекс больше или равен 0)
-        if selected_row < 0:
+        # строки всех выделенных диапазонов, в том числе выделенных через Ctrl и Shift
+        selected_rows = sorted({index.row() for index in self.table.selectionModel().selectedRows()})
+
+        # проверяем, что выбрана хотя бы одна строка
+        if not selected_rows:
             QMessageBox.warning(self, 'Предупреждение', 'Пожалуйста, выберите строку для удаления.')
             return
 
-        # получаем ID пароля из первой ячейки выбранной строки (предположим, что это ID)
-        id_item = self.table.item(selected_row, 0)  # ID должно быть в первой ячейке, если вы его добавляли в таблицу
-        if id_item is None:
-            QMessageBox.warning(self, 'Ошибка', 'Не удалось найти ID для удаления.')
+        # одно подтверждение на все выделенные записи
+        reply = QMessageBox.question(
+            self, 'Подтверждение', f'Удалить выделенные пароли ({len(selected_rows)})?',
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+        )
+        if reply != QMessageBox.StandardButton.Yes:
             return
-        
-        password_id = int(id_item.text())  # преобразуем в целое число для использования в SQL-запросе
 
-        # создаём объект DBHandler для работы с базой данных
-        db_handler = DBHandler()
+        # получаем ID паролей из модели таблицы
+        password_ids = [self.model.row_id(row) for row in selected_rows]
 
-        # удаляем пароль из базы данных
+        # удаляем пароли из базы данных одной транзакцией через общее соединение окна
         try:
-            db_handler.delete_password(password_id)  # удаляем пароль по ID из базы данных
-            self.table.removeRow(selected_row)  # удаляем строку из таблицы в интерфейсе
-
-            # уведомляем пользователя об успешном удалении
-            QMessageBox.information(self, 'Успех', 'Пароль был успешно удалён.')
+            deleted = self.cache.delete_passwords(password_ids)
+            self.model.remove_ids(deleted)  # убираем строки из таблицы за один проход
 
         except Exception as e:
-            QMessageBox.critical(self, 'Ошибка', f'Не удалось удалить пароль: {e}')
+            QMessageBox.critical(self, 'Ошибка', f'Не удалось удалить пароли: {e}')
 
     def open_password_settings(self):
         dialog = QDialog(self)
@@ -218,23 +276,20 @@ class PasswordManager(QMainWindow):
         dialog.accept()
 
     def load_passwords(self):
-        self.table.setRowCount(0)
-        passwords = self.db.get_passwords(self.filter_input.text())
-        for row_number, row_data in enumerate(passwords):
-            self.table.insertRow(row_number)
-            self.table.setItem(row_number, 0, QTableWidgetItem(str(row_data[0])))  # ID
-            for column_number, data in enumerate(row_data[1:], start=1):  # начинаем с 1 для остальных колонок
-                if column_number == 2 and not self.show_passwords:
-                    self.table.setItem(row_number, column_number, QTableWidgetItem("***"))
-                else:
-                    self.table.setItem(row_number, column_number, QTableWidgetItem(str(data)))
-
+        # модель сама подгружает страницы, здесь только сброс под текущий фильтр;
+        # отметку наблюдателя сдвигаем до чтения, чтобы не пропустить изменения между ними
+        self.change_watcher.reset()
+        self.model.set_filter(self.filter_input.text())
 
     def toggle_password_visibility(self):
+        if not self.show_passwords and not self.ensure_unlocked():
+            return
         self.show_passwords = not self.show_passwords
-        self.load_passwords()
+        self.model.set_show_passwords(self.show_passwords)
 
     def add_password(self):
+        if not self.ensure_unlocked():
+            return
         # выбор способа добавления пароля
         choice, ok = QInputDialog.getItem(
             self,
@@ -258,7 +313,7 @@ class PasswordManager(QMainWindow):
         layout = QVBoxLayout(dialog)
 
         name_input = QLineEdit()
-        name_input.setPlaceholderText("Заметка(не обязательно)")
+        name_input.setPlaceholderText("Название")
         layout.addWidget(name_input)
 
         username_input = QLineEdit()
@@ -270,6 +325,10 @@ class PasswordManager(QMainWindow):
         password_input.setPlaceholderText("Пароль")
         layout.addWidget(password_input)
 
+        note_input = QLineEdit()
+        note_input.setPlaceholderText("Заметка (не обязательно)")
+        layout.addWidget(note_input)
+
         # прогресс-бар для сложности пароля
         complexity_progress = QProgressBar()
         complexity_progress.setMaximum(5)  # максимальное значение сложности (5 факторов)
@@ -279,10 +338,14 @@ class PasswordManager(QMainWindow):
         password_strength_label = QLabel("Сложность пароля: Низкая")
         layout.addWidget(password_strength_label)
 
+        # оценщик хранит состояние набранного префикса, поэтому каждый символ считается за микросекунды
+        estimator = StrengthEstimator()
+
         def update_password_complexity():
             password = password_input.text()
             try:
-                complexity = self.evaluate_complexity(password)
+                estimate = estimator.estimate(password)
+                complexity = estimate["score"]
                 complexity_progress.setValue(complexity)
 
                 # обновляем текст в зависимости от сложности
@@ -296,6 +359,12 @@ class PasswordManager(QMainWindow):
                     password_strength_label.setText("Сложность пароля: Хороший")
                 elif complexity == 4 or complexity == 5:
                     password_strength_label.setText("Сложность пароля: Очень сильный")
+                # называем найденные шаблоны, но не сами куски: поле пароля скрыто
+                kinds = sorted({kind for kind, _ in estimate["patterns"]})
+                if kinds:
+                    password_strength_label.setText(
+                        password_strength_label.text() + " (найдено: " + ", ".join(kinds) + ")"
+                    )
             except Exception as e:
                 QMessageBox.warning(self, "Ошибка", f"Ошибка при вычислении сложности пароля: {str(e)}")
 
@@ -303,36 +372,14 @@ class PasswordManager(QMainWindow):
         password_input.textChanged.connect(update_password_complexity)
 
         save_button = QPushButton("Сохранить")
-        save_button.clicked.connect(lambda: self.save_password_manually(dialog, name_input, username_input, password_input))
+        save_button.clicked.connect(
+            lambda: self.save_password_manually(dialog, name_input, username_input, password_input, note_input)
+        )
         layout.addWidget(save_button)
 
         dialog.setLayout(layout)
         dialog.exec()
 
-    @staticmethod
-    def evaluate_complexity(password):
-        """оценка сложности пароля"""
-        length_score = len(password) >= 12
-        has_uppercase = bool(re.search(r"[A-Z]", password))
-        has_lowercase = bool(re.search(r"[a-z]", password))
-        has_digit = bool(re.search(r"\d", password))
-        has_special = bool(re.search(r"[!@#$%^&*(),.?\":{}|<>]", password))
-
-        complexity = 0
-        if length_score:
-            complexity += 1
-        if has_uppercase:
-            complexity += 1
-        if has_lowercase:
-            complexity += 1
-        if has_digit:
-            complexity += 1
-        if has_special:
-            complexity += 1
-
-        return complexity
-
-
     def add_password_generated(self):
         # окно генерации пароля
         dialog = QDialog(self)
@@ -393,23 +440,10 @@ class PasswordManager(QMainWindow):
         except Exception as e:
             QMessageBox.warning(self, "Ошибка", f"Произошла неизвестная ошибка: {e}")
 
-    def update_progress(self, progress, password, progress_bar, password_display, generator, timer):
-        password = generator.generate_password()
-        progress += 1
-        progress_bar.setValue(progress)
-        password_display.setText(password)
-
-        if progress >= 100:
-            timer.stop()
-            QMessageBox.information(self, "Генерация завершена", "Пароль сгенерирован.")
-            password_display.setText(password)
-            generator.stop_generating()  # переменная состояния остановки генерации
-
     def save_password_manually(self, dialog, name_input, username_input, password_input, note_input=None):
-        # перепутаны местами переменные для пароля и имени пользователя
-        name = username_input.text().strip()  # имя пользователя
-        username = password_input.text().strip()  # пароль
-        password = name_input.text().strip()  # название
+        name = name_input.text().strip()  # название
+        username = username_input.text().strip()  # имя пользователя
+        password = password_input.text()  # пароль, пробелы по краям - его часть
         note = note_input.text().strip() if note_input else ""  # заметка (если есть)
 
         # проверка, что обязательные поля заполнены
@@ -417,12 +451,28 @@ class PasswordManager(QMainWindow):
             QMessageBox.warning(self, "Ошибка", "Пожалуйста, заполните все обязательные поля.")
             return
 
-        # сохраняем пароль в базе данных
-        self.db.add_password(name, username, password, note)
-        
+        # предупреждаем, если пароль есть в локальной базе утечек
+        if not self.confirm_not_breached(dialog, password):
+            return
+
+        # пока диалог был открыт, хранилище могло заблокироваться по простою
+        if not self.ensure_unlocked():
+            return
+
+        # сохраняем пароль в базе данных и добавляем строку в таблицу без перезагрузки
+        try:
+            password_id = self.cache.add_password(name, username, password, note)
+        except PasswordManagerError as e:
+            QMessageBox.warning(dialog, "Ошибка", f"Не удалось сохранить пароль: {e}")
+            return
+        if password_id is None:
+            # add_password уже записал причину в журнал
+            QMessageBox.warning(dialog, "Ошибка", "Не удалось сохранить пароль.")
+            return
+        self.model.append_row(password_id)
+
         # закрываем диалоговое окно после сохранения
         dialog.accept()
-        self.load_passwords()
         QMessageBox.information(self, "Успешно", "Пароль успешно сохранен.")
 
     def save_generated_password(self, dialog, password_display, name_input, note_input):
@@ -437,8 +487,18 @@ class PasswordManager(QMainWindow):
                 QMessageBox.warning(dialog, 'Ошибка', 'Заполните все обязательные поля.')
                 return
 
-            # жобавляем пароль в базу данных
-            self.db.add_password(name, password, note)
+            if not self.confirm_not_breached(dialog, password):
+                return
+
+            if not self.ensure_unlocked():
+                return
+
+            # добавляем пароль в базу данных, имя пользователя служит и названием записи
+            password_id = self.cache.add_password(name, name, password, note)
+            if password_id is None:
+                QMessageBox.warning(dialog, 'Ошибка', 'Не удалось сохранить пароль.')
+                return
+            self.model.append_row(password_id)
 
             QMessageBox.information(dialog, 'Успех', 'Пароль успешно сохранён.')
             dialog.accept()  # закрываем диалог
@@ -447,41 +507,426 @@ class PasswordManager(QMainWindow):
             QMessageBox.critical(dialog, 'Ошибка', f'Не удалось сохранить пароль: {e}')
             print(f"Ошибка при сохранении пароля: {e}")  # выводим ошибку в консоль
 
+    def closeEvent(self, event):
+        # закрываем соединения с базой данных и файл утечек при выходе
+        self.change_watcher.stop()
+        if self.breach_corpus is not None:
+            self.breach_corpus.close()
+        if self.db.instrumentation is not None:
+            self.db.instrumentation.to_json(self.query_stats_path)
+        self.db.close()
+        super().closeEvent(event)
+
     def refresh_data(self):
+        # явное обновление перечитывает всё из базы, обычно хватает наблюдателя изменений
+        self.cache.clear()
         self.load_passwords()
 
     def export_passwords(self):
-        file_path, _ = QFileDialog.getSaveFileName(self, "Экспортировать пароли", "", "CSV Files (*.csv)")
+        if not self.ensure_unlocked():
+            return
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "Экспортировать пароли", "", "CSV Files (*.csv);;Gzip CSV Files (*.csv.gz)"
+        )
         if file_path:
             try:
-                passwords = self.db.get_all_passwords()
-                with open(file_path, "w", newline='', encoding="utf-8") as file:
-                    writer = csv.writer(file)
-                    writer.writerow(["Название", "Имя пользователя", "Пароль", "Заметка"])
-                    for password in passwords:
-                        writer.writerow(password)
-                QMessageBox.information(self, "Успешно", "Пароли успешно экспортированы.")
+                # общий потоковый экспорт с CSVHandler, gzip включается по расширению .gz
+                count = CSVHandler(self.db).export_to_csv(file_path)
+                QMessageBox.information(self, "Успешно", f"Пароли успешно экспортированы: {count}.")
             except Exception as e:
                 QMessageBox.warning(self, "Ошибка", f"Не удалось экспортировать пароли: {e}")
 
     def import_passwords(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "Импортировать пароли", "", "CSV Files (*.csv)")
-        if file_path:
+        if not self.ensure_unlocked():
+            return
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Импортировать пароли", "", "CSV Files (*.csv);;Gzip CSV Files (*.csv.gz)"
+        )
+        if not file_path:
+            return
+
+        # чтение, проверка и запись пачками идут в пуле потоков, окно остается отзывчивым
+        progress = QProgressDialog("Импорт паролей...", "Отмена", 0, 1000, self)
+        progress.setWindowTitle("Импорт паролей")
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
+
+        task = BackgroundTask(run_import, self.db, file_path)
+        task.signals.progress.connect(lambda state: self.update_import_progress(progress, state))
+        task.signals.finished.connect(lambda summary: self.import_finished(progress, summary))
+        task.signals.failed.connect(lambda error: self.import_failed(progress, error))
+        progress.canceled.connect(task.cancel)
+        self._import_task = task
+        self.import_button.setEnabled(False)
+        progress.show()
+        QThreadPool.globalInstance().start(task)
+
+    def update_import_progress(self, progress, state):
+        progress.setValue(int(1000 * state["bytes"] / state["total_bytes"]))
+        progress.setLabelText(f"Импортировано записей: {state['rows']}")
+
+    def import_finished(self, progress, summary):
+        progress.close()
+        self.import_button.setEnabled(True)
+        self.cache.clear()
+        self.load_passwords()
+
+        message = f"Импортировано записей: {summary['imported']}."
+        if summary["cancelled"]:
+            message = "Импорт отменен, незавершенная пачка откатана.\n" + message
+        if summary["rejected_count"]:
+            details = "\n".join(f"строка {line}: {reason}" for line, reason in summary["rejected"][:20])
+            message += f"\nОтклонено строк: {summary['rejected_count']}\n\n{details}"
+        QMessageBox.information(self, "Импорт паролей", message)
+
+    def import_failed(self, progress, error):
+        progress.close()
+        self.import_button.setEnabled(True)
+        self.cache.clear()
+        self.load_passwords()
+        QMessageBox.warning(self, "Ошибка", f"Не удалось импортировать пароли: {error}")
+
+    def backup_vault(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Резервная копия", "", "SQLite Files (*.db)")
+        if not file_path:
+            return
+        mode, ok = QInputDialog.getItem(
+            self, "Резервная копия", "Способ копирования:",
+            ["Постраничная копия", "Сжатая копия (VACUUM INTO)"], 0, False
+        )
+        if not ok:
+            return
+
+        def make_backup(task):
+            if mode == "Постраничная копия":
+                self.db.backup(file_path, progress_callback=lambda copied, total: task.report((copied, total)))
+            else:
+                # VACUUM INTO не перезаписывает существующий файл
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                self.db.vacuum_into(file_path)
+
+        self.run_snapshot_task("Резервная копия", make_backup, "Резервная копия создана и проверена.")
+
+    def restore_vault(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Восстановить из копии", "", "SQLite Files (*.db)")
+        if not file_path:
+            return
+        answer = QMessageBox.question(
+            self, "Восстановить", "Текущие данные будут заменены содержимым копии. Продолжить?"
+        )
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+
+        def restore(task):
+            self.db.restore(file_path, progress_callback=lambda copied, total: task.report((copied, total)))
+
+        self.run_snapshot_task("Восстановление", restore, "Данные восстановлены из копии.")
+
+    def merge_vaults(self):
+        """вливает записи другой базы: сначала показывает, что изменится, потом применяет"""
+        if not self.ensure_unlocked():
+            return
+        file_path, _ = QFileDialog.getOpenFileName(self, "Объединить с базой", "", "SQLite Files (*.db)")
+        if not file_path:
+            return
+        policies = {
+            "Оставить более новую": "newest",
+            "Оставить свою": "local",
+            "Сохранить обе": "both",
+        }
+        label, ok = QInputDialog.getItem(
+            self, "Объединить базы", "Если у записи с тем же названием и логином\n"
+            "разные пароль или заметка:", list(policies), 0, False
+        )
+        if not ok:
+            return
+        policy = policies[label]
+        master_password = None
+        try:
+            encrypted = DBHandler.vault_file_encrypted(file_path)
+        except Exception as e:
+            QMessageBox.warning(self, "Ошибка", f"Не удалось открыть базу: {e}")
+            return
+        if encrypted:
+            master_password, ok = QInputDialog.getText(
+                self, "Объединить базы", "Мастер-пароль выбранной базы:", QLineEdit.EchoMode.Password
+            )
+            if not ok:
+                return
+
+        # пробный проход только считает изменения, он тоже читает обе базы целиком
+        self.merge_button.setEnabled(False)
+        task = BackgroundTask(
+            lambda task: self.db.merge_from(file_path, policy, dry_run=True, master_password=master_password)
+        )
+        task.signals.finished.connect(
+            lambda report: self.confirm_merge(file_path, policy, master_password, report)
+        )
+        task.signals.failed.connect(self.merge_failed)
+        self._merge_task = task
+        QThreadPool.globalInstance().start(task)
+
+    def confirm_merge(self, file_path, policy, master_password, report):
+        self.merge_button.setEnabled(True)
+        decisions = {"update": "заменить своей", "copy": "сохранить обе", "keep": "оставить свою"}
+        conflicts = "\n".join(
+            f"{name} ({username}): {decisions[action]}" for name, username, action in report["conflicts"][:20]
+        )
+        summary = (
+            f"Новых записей: {report['added']}\n"
+            f"Заменить своих: {report['updated']}\n"
+            f"Сохранить обе: {report['kept_both']}\n"
+            f"Оставить свои: {report['kept_local']}\n"
+            f"Уже совпадают: {report['unchanged']}"
+        )
+        if conflicts:
+            summary += f"\n\nКонфликты:\n{conflicts}"
+        answer = QMessageBox.question(self, "Объединить базы", f"{summary}\n\nПрименить изменения?")
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+
+        def merge(task):
+            self.db.merge_from(file_path, policy, master_password=master_password)
+
+        self.run_snapshot_task("Объединение", merge, "Базы объединены.")
+
+    def merge_failed(self, error):
+        self.merge_button.setEnabled(True)
+        QMessageBox.warning(self, "Ошибка", f"Не удалось объединить базы: {error}")
+
+    def run_snapshot_task(self, title, fn, success_message):
+        """выполняет копирование или восстановление в пуле потоков с окном прогресса"""
+        progress = QProgressDialog(f"{title}...", None, 0, 0, self)
+        progress.setWindowTitle(title)
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setAutoClose(False)
+
+        def update(state):
+            copied, total = state
+            progress.setMaximum(total)
+            progress.setValue(copied)
+
+        def finished(_):
+            progress.close()
+            self.cache.clear()
+            self.load_passwords()
+            QMessageBox.information(self, title, success_message)
+
+        def failed(error):
+            progress.close()
+            QMessageBox.warning(self, "Ошибка", f"{title}: {error}")
+
+        task = BackgroundTask(fn)
+        task.signals.progress.connect(update)
+        task.signals.finished.connect(finished)
+        task.signals.failed.connect(failed)
+        self._snapshot_task = task
+        progress.show()
+        QThreadPool.globalInstance().start(task)
+
+    def audit_passwords(self):
+        if not self.ensure_unlocked():
+            return
+        # оценка выполняется в пуле потоков, переоцениваются только новые и измененные строки
+        self.audit_button.setEnabled(False)
+        task = BackgroundTask(lambda task: StrengthAudit(self.db).run())
+        task.signals.finished.connect(self.show_audit_report)
+        task.signals.failed.connect(self.audit_failed)
+        self._audit_task = task
+        QThreadPool.globalInstance().start(task)
+
+    def show_audit_report(self, report):
+        self.audit_button.setEnabled(True)
+        distribution = "\n".join(
+            f"  {score}: {count}" for score, count in report["distribution"].items()
+        )
+        QMessageBox.information(
+            self, "Аудит паролей",
+            f"Всего записей: {report['total']}\n"
+            f"Слабых паролей: {report['weak']}\n"
+            f"Повторяющихся паролей: {report['reused']} в {report['reuse_groups']} группах\n"
+            f"Переоценено сейчас: {report['scored_now']}\n\n"
+            f"Распределение оценок:\n{distribution}"
+        )
+
+    def audit_failed(self, error):
+        self.audit_button.setEnabled(True)
+        QMessageBox.warning(self, "Ошибка", f"Не удалось провести аудит: {error}")
+
+    def ensure_unlocked(self):
+        """True, если ключ хранилища доступен; иначе спрашивает мастер-пароль"""
+        while self.db.locked:
+            master_password, ok = QInputDialog.getText(
+                self, "Мастер-пароль", "Введите мастер-пароль:", QLineEdit.EchoMode.Password
+            )
+            if not ok:
+                return False
             try:
-                with open(file_path, "r", newline='', encoding="utf-8") as file:
-                    reader = csv.reader(file)
-                    next(reader)  # пропускаем заголовок
-                    for row in reader:
-                        if row:  # проверка на пустые строки
-                            self.db.save_password(row[0], row[1], row[2], row[3])
-                self.load_passwords()
-                QMessageBox.information(self, "Успешно", "Пароли успешно импортированы.")
-            except Exception as e:
-                QMessageBox.warning(self, "Ошибка", f"Не удалось импортировать пароли: {e}")
+                self.db.unlock(master_password)
+            except InvalidMasterPasswordError as e:
+                QMessageBox.warning(self, "Ошибка", str(e).capitalize() + ".")
+                continue
+            # пароли и заметки в таблице теперь можно расшифровать
+            self.model.refresh_payloads()
+        return True
+
+    def ask_new_master_password(self):
+        """спрашивает новый мастер-пароль дважды, возвращает его или None"""
+        master_password, ok = QInputDialog.getText(
+            self, "Шифрование", "Новый мастер-пароль:", QLineEdit.EchoMode.Password
+        )
+        if not ok:
+            return None
+        if len(master_password) < 8:
+            QMessageBox.warning(self, "Ошибка", "Мастер-пароль должен быть не короче 8 символов.")
+            return None
+        repeated, ok = QInputDialog.getText(
+            self, "Шифрование", "Повторите мастер-пароль:", QLineEdit.EchoMode.Password
+        )
+        if not ok:
+            return None
+        if repeated != master_password:
+            QMessageBox.warning(self, "Ошибка", "Пароли не совпадают.")
+            return None
+        return master_password
+
+    def manage_encryption(self):
+        """включает шифрование хранилища или меняет мастер-пароль"""
+        if self.db.encrypted and not self.ensure_unlocked():
+            return
+        master_password = self.ask_new_master_password()
+        if master_password is None:
+            return
+        total = self.db.execute_query("SELECT COUNT(*) FROM passwords")[0][0]
+
+        if self.db.encrypted:
+            def rekey(task):
+                self.db.change_master_password(
+                    master_password, progress_callback=lambda done: task.report((done, total))
+                )
+
+            self.run_snapshot_task("Смена мастер-пароля", rekey, "Хранилище перешифровано новым ключом.")
+            return
+
+        def encrypt(task):
+            self.db.encrypt_vault(master_password, progress_callback=lambda done: task.report((done, total)))
+
+        self.run_snapshot_task("Шифрование", encrypt, "Пароли и заметки теперь хранятся зашифрованными.")
+
+    def confirm_not_breached(self, dialog, password):
+        """True, если пароль не найден в утечках или пользователь всё равно хочет его сохранить"""
+        if self.breach_corpus is None:
+            return True
+        count = self.breach_corpus.count(password)
+        if not count:
+            return True
+        answer = QMessageBox.question(
+            dialog, "Пароль в утечках",
+            f"Этот пароль встречался в утечках {count} раз. Всё равно сохранить?"
+        )
+        return answer == QMessageBox.StandardButton.Yes
+
+    def check_breaches(self):
+        if not self.ensure_unlocked():
+            return
+        if self.breach_corpus is None:
+            file_path, _ = QFileDialog.getOpenFileName(
+                self, "Файл утечек (SHA-1:count)", "", "Text Files (*.txt);;All Files (*)"
+            )
+            if not file_path:
+                return
+            try:
+                self.breach_corpus = BreachCorpus(file_path)
+            except OSError as e:
+                QMessageBox.warning(self, "Ошибка", f"Не удалось открыть файл утечек: {e}")
+                return
+
+        # проверка всего хранилища идет в пуле потоков
+        progress = QProgressDialog("Проверка паролей...", "Отмена", 0, 0, self)
+        progress.setWindowTitle("Проверка утечек")
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
+
+        task = BackgroundTask(check_vault, self.db, self.breach_corpus)
+        task.signals.progress.connect(lambda checked: progress.setLabelText(f"Проверено паролей: {checked}"))
+        task.signals.finished.connect(lambda found: self.show_breach_report(progress, task, found))
+        task.signals.failed.connect(lambda error: self.breach_check_failed(progress, error))
+        progress.canceled.connect(task.cancel)
+        self._breach_task = task
+        self.breach_button.setEnabled(False)
+        progress.show()
+        QThreadPool.globalInstance().start(task)
+
+    def show_breach_report(self, progress, task, found):
+        progress.close()
+        self.breach_button.setEnabled(True)
+        prefix = "Проверка отменена, проверена только часть паролей.\n" if task.cancelled else ""
+        if not found:
+            QMessageBox.information(self, "Проверка утечек", prefix + "Пароли из хранилища в утечках не найдены.")
+            return
+        lines = "\n".join(f"{name} ({username}): {count} раз" for _, name, username, count in found[:20])
+        if len(found) > 20:
+            lines += f"\n... и еще {len(found) - 20}"
+        QMessageBox.warning(self, "Проверка утечек", f"{prefix}Найдено в утечках: {len(found)}\n\n{lines}")
+
+    def breach_check_failed(self, progress, error):
+        progress.close()
+        self.breach_button.setEnabled(True)
+        QMessageBox.warning(self, "Ошибка", f"Не удалось проверить пароли: {error}")
+
+
+# слоты, которые замеряет режим --profile
+PROFILED_SLOTS = {
+    PasswordManager: (
+        "load_passwords", "refresh_data", "add_password", "add_password_manually", "add_password_generated",
+        "save_password_manually", "save_generated_password", "delete_password", "toggle_password_visibility",
+        "export_passwords", "import_passwords", "import_finished", "merge_vaults", "confirm_merge",
+        "backup_vault", "restore_vault", "audit_passwords", "check_breaches", "manage_encryption",
+    ),
+    SearchController: ("search", "_apply"),
+    PasswordTableModel: ("fetchMore", "sort", "merge_rows"),
+    ChangeWatcher: ("poll",),
+}
+
+
+def parse_args(argv):
+    """разбирает свои ключи, остальные аргументы командной строки достаются Qt"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="менеджер паролей")
+    parser.add_argument("--profile", nargs="?", const="profile.json", metavar="ОТЧЕТ.json",
+                        help="замерять слоты и зависания окна, отчет пишется при выходе")
+    parser.add_argument("--profile-threshold", type=float, default=100.0, metavar="МС",
+                        help="после скольких миллисекунд занятости окна снимать стек")
+    parser.add_argument("--profile-action", action="append", default=[], metavar="СЛОТ",
+                        help="запускать cProfile на время слота, например import_passwords")
+    return parser.parse_known_args(argv)
 
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    args, qt_args = parse_args(sys.argv[1:])
+    profiler = None
+    if args.profile:
+        from ui_profiler import UIProfiler
+
+        profiler = UIProfiler(args.profile_threshold, profile_actions=args.profile_action)
+        # методы подменяются до создания окна, иначе кнопки останутся подключены к исходным
+        for cls, names in PROFILED_SLOTS.items():
+            profiler.instrument(cls, names)
+        # запросы к базе замеряет уже существующая статистика запросов
+        os.environ.setdefault(
+            "PASSWORD_MANAGER_QUERY_STATS", os.path.splitext(args.profile)[0] + ".queries.json"
+        )
+    app = QApplication(sys.argv[:1] + qt_args)
+    if profiler is not None:
+        profiler.start()
     window = PasswordManager()
     window.show()
-    sys.exit(app.exec())
+    exit_code = app.exec()
+    if profiler is not None:
+        profiler.stop()
+        profiler.write(args.profile)
+    sys.exit(exit_code)
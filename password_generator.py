@@ -1,6 +1,45 @@
 #password_generator.py
-import random
-import string
+import os
+from functools import lru_cache
+
+import strength_audit
+from strength_audit import DIGITS, LOWERCASE, PUNCTUATION, UPPERCASE
+
+
+@lru_cache(maxsize=None)
+def _alphabet(use_digits, use_special_chars):
+    """собирает алфавит пароля из включенных классов символов"""
+    characters = LOWERCASE + UPPERCASE  # буквы (верхний и нижний регистры)
+    if use_digits:
+        characters += DIGITS  # цифры
+    if use_special_chars:
+        characters += PUNCTUATION  # спецсимволы
+    return characters
+
+
+@lru_cache(maxsize=None)
+def _byte_table(characters):
+    """таблицы перевода случайных байтов в символы алфавита
+
+    байты от limit и выше отбрасываются (rejection sampling), поэтому каждый
+    символ алфавита выпадает с одинаковой вероятностью"""
+    size = len(characters)
+    limit = 256 - 256 % size
+    table = bytes(ord(characters[b % size]) for b in range(256))
+    rejected = bytes(range(limit, 256))
+    return table, rejected, limit
+
+
+def _random_characters(characters, count):
+    """строка из count равновероятных символов алфавита из os.urandom"""
+    table, rejected, limit = _byte_table(characters)
+    result = ""
+    while len(result) < count:
+        need = count - len(result)
+        # с запасом на отброшенные байты
+        raw = os.urandom(need * 256 // limit + 64)
+        result += raw.translate(table, rejected).decode("ascii")[:need]
+    return result
 
 
 class PasswordGenerator:
@@ -12,24 +51,49 @@ class PasswordGenerator:
 
     def generate(self):
         """генерирует случайный пароль"""
-        characters = string.ascii_letters  # буквы (верхний и нижний регистры)
-        if self.use_digits:
-            characters += string.digits  # цифры
-        if self.use_special_chars:
-            characters += string.punctuation  # спецсимволы
+        return self.generate_many(1)[0]
+
+    def generate_many(self, n, min_lower=0, min_upper=0, min_digits=0, min_special=0):
+        """генерирует n паролей из криптографически стойкого источника os.urandom
 
+        случайные байты переводятся в символы пачкой через bytes.translate. при заданных
+        минимумах сначала вытягиваются обязательные символы каждого класса, остаток
+        добирается из всего алфавита, и символы пароля перемешиваются"""
         if self.length < 8:
             raise ValueError("Длина пароля должна быть не менее 8 символов.")
-        return ''.join(random.choice(characters) for _ in range(self.length))
+        if min_digits and not self.use_digits:
+            raise ValueError("Цифры отключены, минимум цифр задать нельзя.")
+        if min_special and not self.use_special_chars:
+            raise ValueError("Спецсимволы отключены, минимум спецсимволов задать нельзя.")
+        if min_lower + min_upper + min_digits + min_special > self.length:
+            raise ValueError("Сумма минимумов больше длины пароля.")
+
+        alphabet = _alphabet(self.use_digits, self.use_special_chars)
+        length = self.length
+        minimums = [(characters, count) for characters, count in
+                    ((LOWERCASE, min_lower), (UPPERCASE, min_upper), (DIGITS, min_digits),
+                     (PUNCTUATION, min_special))
+                    if count]
+        if not minimums:
+            characters = _random_characters(alphabet, n * length)
+            return [characters[i:i + length] for i in range(0, n * length, length)]
+
+        # shuffle у SystemRandom - тасование Фишера-Йетса на os.urandom, без перекоса
+        from random import SystemRandom
+        shuffle = SystemRandom().shuffle
+        required = [(_random_characters(characters, n * count), count) for characters, count in minimums]
+        rest = length - sum(count for _, count in minimums)
+        fill = _random_characters(alphabet, n * rest)
+        passwords = []
+        for i in range(n):
+            password = list(fill[i * rest:(i + 1) * rest])
+            for characters, count in required:
+                password.extend(characters[i * count:(i + 1) * count])
+            shuffle(password)
+            passwords.append("".join(password))
+        return passwords
 
     @staticmethod
     def is_strong(password):
         """проверяет сложность пароля"""
-        if len(password) < 8:
-            return False
-        has_upper = any(c.isupper() for c in password)
-        has_lower = any(c.islower() for c in password)
-        has_digit = any(c.isdigit() for c in password)
-        has_special = any(c in string.punctuation for c in password)
-        return all([has_upper, has_lower, has_digit, has_special])
-
+        return strength_audit.is_strong(password)
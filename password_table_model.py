@@ -0,0 +1,201 @@
+# password_table_model.py
+from array import array
+
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+from exceptions import DatabaseError, VaultLockedError
+from vault_cache import PAYLOAD_COLUMNS
+
+
+class PasswordTableModel(QAbstractTableModel):
+    """ленивая модель таблицы паролей: строки подгружаются страницами по мере прокрутки"""
+
+    HEADERS = ["ID", "Название", "Имя пользователя", "Пароль", "Заметка"]
+    PASSWORD_COLUMN = 3
+    # колонки таблицы, по которым база умеет сортировать по индексу
+    SORT_COLUMNS = {0: "id", 1: "name", 2: "username"}
+
+    def __init__(self, cache, page_size=200, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.page_size = page_size
+        self.filter_text = ""
+        self.show_passwords = False
+        self.sort_column = "id"
+        self.descending = False
+        # модель хранит только id строк, сами записи лежат в VaultCache
+        self._ids = array("q")
+        self._exhausted = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._ids)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        column = index.column()
+        # маскируем пароль здесь, поэтому переключение видимости - это просто перерисовка
+        if column == self.PASSWORD_COLUMN and not self.show_passwords:
+            return "***"
+        password_id = self._ids[index.row()]
+        if column < self.PASSWORD_COLUMN:
+            value = self.cache.row(password_id)[column]
+        else:
+            try:
+                # расшифровываются только ячейки, которые таблица действительно рисует
+                value = self.cache.reveal(password_id, PAYLOAD_COLUMNS[column - self.PASSWORD_COLUMN])
+            except VaultLockedError:
+                return "***"
+            except DatabaseError:
+                return "<повреждено>"
+        return "" if value is None else str(value)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        """подгружает следующую страницу строк"""
+        if parent.isValid() or self._exhausted:
+            return
+        after_key = self._key(self._ids[-1]) if self._ids else None
+        ids = self.cache.get_page(self.filter_text, self.sort_column, self.descending, after_key,
+                                  limit=self.page_size)
+        if len(ids) < self.page_size:
+            self._exhausted = True
+        if not ids:
+            return
+        start = len(self._ids)
+        self.beginInsertRows(QModelIndex(), start, start + len(ids) - 1)
+        self._ids.extend(ids)
+        self.endInsertRows()
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        """сортирует таблицу запросом к базе, пароль и заметку сортировать нельзя"""
+        sort_column = self.SORT_COLUMNS.get(column)
+        if sort_column is None:
+            return
+        self.sort_column = sort_column
+        self.descending = order == Qt.SortOrder.DescendingOrder
+        self.set_filter(self.filter_text)
+
+    def set_filter(self, filter_text):
+        """сбрасывает модель под новый фильтр и загружает первую страницу"""
+        self.beginResetModel()
+        self.filter_text = filter_text
+        self._ids = array("q")
+        self._exhausted = False
+        self.endResetModel()
+        self.fetchMore()
+
+    def set_rows(self, filter_text, ids):
+        """показывает готовую первую страницу, полученную в фоновом потоке"""
+        self.beginResetModel()
+        self.filter_text = filter_text
+        self._ids = array("q", ids)
+        self._exhausted = len(self._ids) < self.page_size
+        self.endResetModel()
+
+    def set_show_passwords(self, show_passwords):
+        """переключает маскировку паролей без повторного запроса к базе"""
+        self.show_passwords = show_passwords
+        self.refresh_payloads()
+
+    def refresh_payloads(self):
+        """перерисовывает пароли и заметки, например после ввода мастер-пароля"""
+        if self._ids:
+            self.dataChanged.emit(
+                self.index(0, self.PASSWORD_COLUMN),
+                self.index(len(self._ids) - 1, len(self.HEADERS) - 1),
+            )
+
+    def row_id(self, row):
+        """возвращает id записи в строке таблицы"""
+        return self._ids[row]
+
+    def matches_filter(self, password_id):
+        """проверяет, попадает ли запись под текущий фильтр"""
+        if not self.filter_text:
+            return True
+        _, name, username = self.cache.row(password_id)
+        text = self.filter_text.lower()
+        return text in name.lower() or text in username.lower()
+
+    def append_row(self, password_id):
+        """вставляет новую запись на её место в порядке сортировки без перезагрузки"""
+        if not self.matches_filter(password_id):
+            return
+        key = self._key(password_id)
+        row = self._insert_position(key)
+        # запись после последней загруженной строки придет сама через fetchMore
+        if row == len(self._ids) and not self._exhausted:
+            return
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._ids.insert(row, password_id)
+        self.endInsertRows()
+
+    def merge_rows(self, changed_ids, deleted_ids, max_changes=500):
+        """применяет изменения, сделанные в базе другим окном или процессом
+
+        измененная запись убирается и вставляется заново: могли поменяться и её место
+        в сортировке, и совпадение с фильтром. при большом числе изменений дешевле
+        перечитать первую страницу"""
+        if len(changed_ids) + len(deleted_ids) > max_changes:
+            self.set_filter(self.filter_text)
+            return
+        self.remove_ids(list(deleted_ids) + list(changed_ids))
+        for password_id in changed_ids:
+            self.append_row(password_id)
+
+    def _key(self, password_id):
+        """ключ сортировки записи, такой же, как у DBHandler.page_key"""
+        # (id, name, username) из кэша совпадают с первыми колонками строки базы
+        return self.cache.db.page_key(self.cache.row(password_id), self.sort_column)
+
+    def _insert_position(self, key):
+        """бинарный поиск места для ключа среди загруженных строк"""
+        lo, hi = 0, len(self._ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key = self._key(self._ids[mid])
+            if (mid_key > key) if self.descending else (mid_key < key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def remove_ids(self, password_ids, max_ranges=100):
+        """убирает строки с указанными id за один проход по модели
+
+        соседние строки убираются одним диапазоном, снизу вверх, чтобы номера
+        оставшихся диапазонов не сдвигались. если диапазонов слишком много,
+        модель пересобирается одним сбросом"""
+        password_ids = set(password_ids)
+        rows = [row for row, password_id in enumerate(self._ids) if password_id in password_ids]
+        if not rows:
+            return
+        ranges = []
+        start = previous = rows[0]
+        for row in rows[1:]:
+            if row != previous + 1:
+                ranges.append((start, previous))
+                start = row
+            previous = row
+        ranges.append((start, previous))
+
+        if len(ranges) > max_ranges:
+            self.beginResetModel()
+            self._ids = array("q", (i for i in self._ids if i not in password_ids))
+            self.endResetModel()
+            return
+        for first, last in reversed(ranges):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self._ids[first:last + 1]
+            self.endRemoveRows()
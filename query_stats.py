@@ -0,0 +1,110 @@
+# query_stats.py
+import json
+import logging
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import deque
+
+# границы корзин гистограммы задержек, в миллисекундах
+LATENCY_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, math.inf)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def latency_stats():
+    """пустая сводка задержек: число замеров, сумма, максимум и гистограмма по LATENCY_BUCKETS_MS"""
+    return {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "histogram": [0] * len(LATENCY_BUCKETS_MS)}
+
+
+def record_latency(stats, elapsed_ms):
+    """добавляет замер в сводку latency_stats, вызывается под блокировкой владельца сводки"""
+    stats["count"] += 1
+    stats["total_ms"] += elapsed_ms
+    stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+    # первая корзина, чья граница не меньше замера
+    stats["histogram"][bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+
+def redact_query(query):
+    """убирает из текста запроса литералы и лишние пробелы, параметры в статистику не попадают"""
+    query = _STRING_LITERAL.sub("'?'", query)
+    query = _NUMBER_LITERAL.sub("?", query)
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+class QueryStats:
+    """собирает статистику sql-запросов: гистограммы задержек, число строк и медленные запросы
+
+    подключается к DBHandler через параметр instrumentation, без него замеров нет вовсе"""
+
+    def __init__(self, slow_threshold_ms=100.0, max_slow_queries=100, logger=None):
+        self.slow_threshold_ms = slow_threshold_ms
+        # если задан logger, медленные запросы сразу пишутся в него
+        self.logger = logger
+        self._statements = {}
+        self._slow_queries = deque(maxlen=max_slow_queries)
+        self._lock = threading.Lock()
+
+    def record(self, query, elapsed, rows=0, param_count=0):
+        """учитывает выполнение запроса, elapsed - в секундах"""
+        elapsed_ms = elapsed * 1000
+        statement = redact_query(query)
+        with self._lock:
+            stats = self._statements.get(statement)
+            if stats is None:
+                stats = self._statements[statement] = dict(latency_stats(), rows=0)
+            record_latency(stats, elapsed_ms)
+            stats["rows"] += max(rows, 0)
+            is_slow = elapsed_ms >= self.slow_threshold_ms
+            if is_slow:
+                self._slow_queries.append({
+                    "query": statement,
+                    "elapsed_ms": round(elapsed_ms, 3),
+                    "rows": rows,
+                    "params": f"<{param_count} скрыто>",
+                })
+        if is_slow and self.logger is not None:
+            self.logger.warning("медленный запрос %.1f мс: %s", elapsed_ms, statement)
+
+    def reset(self):
+        """сбрасывает накопленную статистику"""
+        with self._lock:
+            self._statements.clear()
+            self._slow_queries.clear()
+
+    def to_dict(self):
+        """возвращает статистику в виде словаря, готового для json"""
+        with self._lock:
+            statements = [
+                dict(stats, query=query, mean_ms=stats["total_ms"] / stats["count"])
+                for query, stats in self._statements.items()
+            ]
+            slow_queries = list(self._slow_queries)
+        statements.sort(key=lambda stats: stats["total_ms"], reverse=True)
+        return {
+            "buckets_ms": [str(bound) for bound in LATENCY_BUCKETS_MS],
+            "slow_threshold_ms": self.slow_threshold_ms,
+            "statements": statements,
+            "slow_queries": slow_queries,
+        }
+
+    def to_json(self, file_name=None):
+        """сериализует статистику в json, при заданном file_name пишет её в файл"""
+        data = json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+        if file_name is not None:
+            with open(file_name, "w", encoding="utf-8") as file:
+                file.write(data)
+        return data
+
+    def log_summary(self, logger=None, level=logging.INFO, limit=10):
+        """пишет в logging самые дорогие по суммарному времени запросы"""
+        logger = logger or self.logger or logging.getLogger(__name__)
+        for stats in self.to_dict()["statements"][:limit]:
+            logger.log(
+                level, "%d раз, всего %.1f мс, среднее %.3f мс, строк %d: %s",
+                stats["count"], stats["total_ms"], stats["mean_ms"], stats["rows"], stats["query"],
+            )
@@ -0,0 +1,59 @@
+# search_controller.py
+from PyQt6.QtCore import QObject, QThreadPool, QTimer
+
+from background_task import BackgroundTask
+
+
+class SearchController(QObject):
+    """откладывает поиск до паузы в наборе текста и выполняет запрос в пуле потоков
+
+    каждый новый ввод увеличивает номер поколения: запросы старых поколений
+    прерываются через progress handler sqlite, а их результаты отбрасываются"""
+
+    def __init__(self, cache, model, delay=250, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.model = model
+        self.pool = QThreadPool.globalInstance()
+        self._generation = 0
+        self._pending_text = ""
+        # держим ссылки на задачи, пока они не завершились
+        self._tasks = set()
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(self._start_search)
+
+    def search(self, text):
+        """запоминает текст и перезапускает таймер задержки"""
+        self._pending_text = text
+        # все уже запущенные запросы сразу становятся устаревшими
+        self._generation += 1
+        self._timer.start()
+
+    def _start_search(self):
+        task = BackgroundTask(self._run_query, self._pending_text, self.model.sort_column,
+                              self.model.descending, self._generation)
+        task.signals.finished.connect(lambda result, task=task: self._apply(task, result))
+        task.signals.failed.connect(lambda error, task=task: self._tasks.discard(task))
+        self._tasks.add(task)
+        self.pool.start(task)
+
+    def _run_query(self, task, text, sort_column, descending, generation):
+        """выполняется в рабочем потоке со своим соединением к базе"""
+        with self.cache.db.interruptible(lambda: generation != self._generation):
+            ids = self.cache.get_page(text, sort_column, descending, limit=self.model.page_size)
+        return generation, text, (sort_column, descending), ids
+
+    def _apply(self, task, result):
+        self._tasks.discard(task)
+        generation, text, order, ids = result
+        # применяем только результат самого свежего запроса
+        if generation != self._generation:
+            return
+        if order != (self.model.sort_column, self.model.descending):
+            # пока шел запрос, сменилась сортировка: повторяем его с новым порядком
+            self._start_search()
+            return
+        self.model.set_rows(text, ids)
@@ -0,0 +1,73 @@
+# strength_audit.py
+import time
+
+# те же наборы, что в модуле string: сам string импортирует re, а он заметно замедляет запуск
+LOWERCASE = "abcdefghijklmnopqrstuvwxyz"
+UPPERCASE = LOWERCASE.upper()
+DIGITS = "0123456789"
+PUNCTUATION = r"""!"#$%&'()*+,-./:;<=>?@[\]^_`{|}~"""
+
+# минимальная допустимая длина пароля
+MIN_LENGTH = 8
+# оценки не выше этой считаются слабыми
+WEAK_SCORE = 2
+MAX_SCORE = 5
+
+
+def evaluate_complexity(password):
+    """оценка сложности пароля от 0 до 5 по числу попыток перебора, та же, что у индикатора в окне"""
+    # strength_estimator сам берет наборы символов из этого модуля, поэтому импорт здесь
+    from strength_estimator import estimate
+    return estimate(password)["score"]
+
+
+def is_strong(password):
+    """пароль надежный, если он не короче 8 символов и его оценка выше слабой"""
+    return len(password) >= MIN_LENGTH and evaluate_complexity(password) > WEAK_SCORE
+
+
+class StrengthAudit:
+    """оценивает сложность всех паролей хранилища и хранит результат в колонке strength
+
+    переоцениваются только строки с пустой оценкой, то есть новые и измененные"""
+
+    def __init__(self, db, batch_size=5000):
+        self.db = db
+        self.batch_size = batch_size
+
+    def run(self, progress_callback=None):
+        """оценивает неоцененные строки пачками и возвращает сводный отчет"""
+        from strength_estimator import StrengthEstimator
+        # один оценщик на весь проход: общий префикс соседних паролей не пересчитывается
+        estimator = StrengthEstimator()
+        start = time.perf_counter()
+        scored = 0
+        after_id = 0
+        while True:
+            rows = self.db.get_unscored_passwords(after_id, self.batch_size)
+            if not rows:
+                break
+            self.db.set_strengths([(estimator.estimate(password)["score"], password_id)
+                                   for password_id, password in rows])
+            scored += len(rows)
+            after_id = rows[-1][0]
+            if progress_callback is not None:
+                progress_callback(scored)
+        return self.report(scored, time.perf_counter() - start)
+
+    def report(self, scored=0, elapsed=0.0):
+        """сводка по хранилищу: распределение оценок, число слабых и повторяющихся паролей"""
+        distribution = {score: 0 for score in range(MAX_SCORE + 1)}
+        for score, count in self.db.get_strength_distribution().items():
+            if score is not None:
+                distribution[score] = count
+        reuse_groups = self.db.get_reuse_groups()
+        return {
+            "total": sum(distribution.values()),
+            "weak": sum(count for score, count in distribution.items() if score <= WEAK_SCORE),
+            "distribution": distribution,
+            "reuse_groups": len(reuse_groups),
+            "reused": sum(len(group) for group in reuse_groups),
+            "scored_now": scored,
+            "elapsed": elapsed,
+        }
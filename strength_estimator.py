@@ -0,0 +1,357 @@
+# strength_estimator.py
+"""оценка сложности пароля по числу попыток перебора
+
+пароль раскладывается на куски, которые перебирающий угадал бы быстрее
+случайных символов: словарные слова (с заглавными буквами и заменами вида
+p@ssw0rd), повторы, последовательности abc/123, проходы по клавиатуре и даты.
+лучшее разложение ищется динамическим программированием по позициям, и
+состояние каждой позиции сохраняется: при наборе следующего символа
+считается только он, а Backspace просто отбрасывает хвост состояния
+
+словарь - отсортированный массив записей фиксированной длины, его можно
+собрать заранее из списка слов (compile_dictionary) и отобразить в память;
+без файла используется короткий встроенный список"""
+import bisect
+import math
+import mmap
+import os
+
+from strength_audit import DIGITS, LOWERCASE, PUNCTUATION, UPPERCASE
+
+# запись словаря: нормализованное слово, дополненное нулями, и ранг по частоте
+WORD_BYTES = 28
+RANK_BYTES = 4
+RECORD_SIZE = WORD_BYTES + RANK_BYTES
+MIN_WORD_LENGTH = 3
+
+# замены символов на похожие буквы; к ним же приводятся слова словаря
+LEET = str.maketrans({"4": "a", "@": "a", "8": "b", "(": "c", "3": "e", "6": "g", "1": "i", "!": "i",
+                      "|": "l", "0": "o", "$": "s", "5": "s", "7": "t", "+": "t", "2": "z"})
+
+# пороги в битах для оценок 1..5: 10 бит - тысяча попыток, 46 бит - около 10**14
+SCORE_BITS = (10, 20, 27, 33, 46)
+
+# самые частые пароли и слова из них по убыванию частоты, если файла словаря нет
+BUILTIN_WORDS = """
+123456 password 12345678 qwerty 123456789 12345 1234 111111 1234567 dragon 123123 baseball
+abc123 football monkey letmein 696969 shadow master 666666 qwertyuiop 123321 mustang 1234567890
+michael 654321 superman 1qaz2wsx 7777777 121212 000000 qazwsx 123qwe killer trustno1 jordan
+jennifer zxcvbnm asdfgh hunter buster soccer harley batman andrew tigger sunshine iloveyou
+2000 charlie robert thomas hockey ranger daniel starwars klaster 112233 george computer michelle
+jessica pepper 1111 zxcvbn 555555 11111111 131313 freedom 777777 pass maggie 159753 aaaaaa
+ginger princess joshua cheese amanda summer love ashley nicole chelsea biteme matthew access
+yankees 987654321 dallas austin thunder taylor matrix admin welcome login secret hello flower
+passw0rd monkey1 shadow1 qwerty123 password1 google mother father sister brother family friend
+angel orange banana apple purple yellow silver golden diamond winter spring autumn
+july june august october november december january february march april
+lovely forever whatever nothing something samsung apple iphone android windows linux
+йцукен qwertyu пароль parol privet lubov solnce marina natasha sasha dima masha
+""".split()
+
+
+def normalize(text):
+    """приводит текст к виду ключей словаря: нижний регистр и буквы вместо замен"""
+    return text.lower().translate(LEET)
+
+
+def compile_dictionary(words, path=None):
+    """собирает словарь из слов по убыванию частоты, возвращает байты или пишет их в path
+
+    ранг слова - его номер в списке, у одинаковых после нормализации ключей остается лучший"""
+    ranks = {}
+    for rank, word in enumerate(words, 1):
+        key = normalize(word.strip()).encode("utf-8")
+        if MIN_WORD_LENGTH <= len(key) <= WORD_BYTES and key not in ranks:
+            ranks[key] = rank
+    data = b"".join(
+        key.ljust(WORD_BYTES, b"\0") + min(rank, 2 ** 32 - 1).to_bytes(RANK_BYTES, "big")
+        for key, rank in sorted(ranks.items())
+    )
+    if path is None:
+        return data
+    with open(path, "wb") as file:
+        file.write(data)
+    return len(ranks)
+
+
+class Dictionary:
+    """отсортированные записи словаря в памяти или в отображенном файле
+
+    сам объект - последовательность ключей, поэтому поиск идет через bisect
+    без копирования файла в память"""
+
+    def __init__(self, data, file=None):
+        if len(data) % RECORD_SIZE:
+            raise ValueError("Файл словаря поврежден: размер не кратен записи.")
+        self._data = data
+        self._file = file
+        self._count = len(data) // RECORD_SIZE
+
+    @classmethod
+    def open(cls, path):
+        file = open(path, "rb")
+        if os.fstat(file.fileno()).st_size == 0:
+            file.close()
+            return cls(b"")
+        return cls(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ), file)
+
+    def close(self):
+        if self._file is not None:
+            self._data.close()
+            self._file.close()
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        offset = index * RECORD_SIZE
+        return self._data[offset:offset + WORD_BYTES]
+
+    def lookup(self, key, lo=0):
+        """ищет ключ, возвращает (ранг или None, есть ли более длинные слова с этим началом, позиция)
+
+        позицию можно передать как lo при поиске этого же начала с новым символом:
+        такие слова лежат не раньше неё"""
+        i = bisect.bisect_left(self, key.ljust(WORD_BYTES, b"\0"), lo)
+        rank = None
+        if i < self._count and self[i].rstrip(b"\0") == key:
+            offset = i * RECORD_SIZE + WORD_BYTES
+            rank = int.from_bytes(self._data[offset:offset + RANK_BYTES], "big")
+            i += 1
+        extends = i < self._count and self[i].startswith(key)
+        return rank, extends, i
+
+
+_dictionaries = {}
+
+
+def load_dictionary(path=None):
+    """словарь загружается при первой оценке и дальше переиспользуется
+
+    путь по умолчанию задает переменная окружения PASSWORD_MANAGER_DICTIONARY"""
+    path = path or os.environ.get("PASSWORD_MANAGER_DICTIONARY")
+    if path not in _dictionaries:
+        if path and os.path.exists(path):
+            _dictionaries[path] = Dictionary.open(path)
+        else:
+            _dictionaries[path] = Dictionary(compile_dictionary(BUILTIN_WORDS))
+    return _dictionaries[path]
+
+
+def _keyboard_positions():
+    """координаты клавиш qwerty и йцукен: строки сдвинуты так же, как на клавиатуре"""
+    layouts = (
+        (("`1234567890-=", "~!@#$%^&*()_+"), ("qwertyuiop[]\\", "QWERTYUIOP{}|"),
+         ("asdfghjkl;'", 'ASDFGHJKL:"'), ("zxcvbnm,./", "ZXCVBNM<>?")),
+        (("ё1234567890-=", "Ё!\"№;%:?*()_+"), ("йцукенгшщзхъ\\", "ЙЦУКЕНГШЩЗХЪ/"),
+         ("фывапролджэ", "ФЫВАПРОЛДЖЭ"), ("ячсмитьбю.", "ЯЧСМИТЬБЮ,")),
+    )
+    offsets = (0, 1.5, 1.75, 2.25)
+    positions = []
+    for layout in layouts:
+        keys = {}
+        for row, (plain, shifted) in enumerate(layout):
+            for column, (key, shifted_key) in enumerate(zip(plain, shifted)):
+                keys.setdefault(key, (row, column + offsets[row]))
+                keys.setdefault(shifted_key, (row, column + offsets[row]))
+        positions.append(keys)
+    return positions
+
+
+KEYBOARDS = _keyboard_positions()
+KEYBOARD_KEYS = 47
+
+
+def keyboard_direction(a, b):
+    """направление шага между соседними клавишами или None, если клавиши не соседние"""
+    for keys in KEYBOARDS:
+        if a in keys and b in keys:
+            (row_a, x_a), (row_b, x_b) = keys[a], keys[b]
+            dy, dx = row_b - row_a, x_b - x_a
+            if (dy == 0 and abs(dx) == 1) or (abs(dy) == 1 and abs(dx) <= 0.75):
+                return dy, dx > 0
+    return None
+
+
+def char_bits(char):
+    """бит на символ при переборе по его классу"""
+    if char in LOWERCASE or char in UPPERCASE:
+        return math.log2(26)
+    if char in DIGITS:
+        return math.log2(10)
+    if char in PUNCTUATION:
+        return math.log2(33)
+    return math.log2(100)
+
+
+def variation_bits(original, normalized):
+    """цена заглавных букв и замен в словарном слове"""
+    bits = 0.0
+    upper = sum(char.isupper() for char in original)
+    if upper:
+        # Слово и СЛОВО перебирают первыми
+        bits += 1 if upper == len(original) or (upper == 1 and original[0].isupper()) else upper
+    substituted = sum(char.lower() != key for char, key in zip(original, normalized))
+    # слово целиком из цифр (123456) - это само слово, а не замены
+    if substituted and substituted < len(original):
+        bits += substituted
+    return bits
+
+
+def date_bits(segment):
+    """цена куска как даты: год, день и месяц, полная дата с разделителями или без; None - не дата"""
+    digits = segment
+    extra = 0
+    if len(segment) in (8, 10) and segment[2] == segment[5] and segment[2] in ".-/ ":
+        digits = segment[:2] + segment[3:5] + segment[6:]
+        extra = 2
+    if not digits.isdigit() or not digits.isascii():
+        return None
+    if len(digits) == 4:
+        if 1900 <= int(digits) <= 2039:
+            return math.log2(140)
+        return math.log2(366) if _valid_day_month(digits[:2], digits[2:]) else None
+    if len(digits) == 6:
+        if _valid_day_month(digits[:2], digits[2:4]) or _valid_day_month(digits[4:], digits[2:4]):
+            return math.log2(366 * 100) + extra
+    if len(digits) == 8:
+        if (_valid_day_month(digits[:2], digits[2:4]) and 1900 <= int(digits[4:]) <= 2039) or \
+                (1900 <= int(digits[:4]) <= 2039 and _valid_day_month(digits[6:], digits[4:6])):
+            return math.log2(366 * 140) + extra
+    return None
+
+
+def _valid_day_month(day, month):
+    return 1 <= int(day) <= 31 and 1 <= int(month) <= 12
+
+
+def score_for_bits(bits):
+    """оценка от 0 до 5 по числу бит, её же пишет в базу strength_audit"""
+    return bisect.bisect_right(SCORE_BITS, bits)
+
+
+class StrengthEstimator:
+    """инкрементальная оценка для поля ввода: храните один объект на поле
+
+    для каждой позиции пароля хранится лучшая цена префикса и состояние
+    шаблонов, которые могут продолжиться следующим символом"""
+
+    MAX_REPEAT_BLOCK = 12
+
+    def __init__(self, dictionary=None):
+        self.dictionary = dictionary
+        self._password = ""
+        self._normalized = ""
+        self._states = [self._initial_state()]
+
+    @staticmethod
+    def _initial_state():
+        return {
+            "bits": 0.0, "match": None, "words": (),
+            "run": 0, "sequence": 0, "delta": 0, "walk": 0, "direction": None, "turns": 0,
+        }
+
+    def estimate(self, password):
+        """оценка пароля: {"bits", "score", "patterns"}, patterns - [(вид, кусок пароля)]"""
+        if self.dictionary is None:
+            self.dictionary = load_dictionary()
+        # переиспользуем состояние общего с прошлым вызовом префикса
+        common = 0
+        for a, b in zip(self._password, password):
+            if a != b:
+                break
+            common += 1
+        del self._states[common + 1:]
+        self._password = password
+        self._normalized = self._normalized[:common] + normalize(password[common:])
+        for position in range(common + 1, len(password) + 1):
+            self._states.append(self._step(position))
+
+        bits = self._states[-1]["bits"]
+        patterns = []
+        position = len(password)
+        while position > 0:
+            kind, start = self._states[position]["match"]
+            if kind != "перебор":
+                patterns.append((kind, password[start:position]))
+            position = start
+        patterns.reverse()
+        return {"bits": bits, "score": score_for_bits(bits), "patterns": patterns}
+
+    def _step(self, i):
+        """состояние после символа password[i - 1]"""
+        password, normalized, states = self._password, self._normalized, self._states
+        previous = states[i - 1]
+        char = password[i - 1]
+        best = previous["bits"] + char_bits(char)
+        match = ("перебор", i - 1)
+
+        def consider(start, bits, kind):
+            nonlocal best, match
+            if states[start]["bits"] + bits < best:
+                best = states[start]["bits"] + bits
+                match = (kind, start)
+
+        # словарные слова, которые заканчиваются здесь; начала продолжаем с прошлой позиции
+        words = []
+        for start, lo in previous["words"] + ((i - 1, 0),):
+            key = normalized[start:i].encode("utf-8")
+            if len(key) > WORD_BYTES:
+                continue
+            rank, extends, lo = self.dictionary.lookup(key, lo)
+            if rank is not None:
+                consider(start, math.log2(rank + 1) + variation_bits(password[start:i], normalized[start:i]),
+                         "словарное слово")
+            if extends:
+                words.append((start, lo))
+
+        # один символ подряд: aaaa
+        run = previous["run"] if i > 1 and password[i - 2] == char else i - 1
+        if i - run >= 3:
+            consider(run, char_bits(char) + math.log2(i - run), "повтор")
+
+        # повтор блока: abcabc, второй экземпляр почти ничего не стоит
+        for size in range(2, min(self.MAX_REPEAT_BLOCK, i // 2) + 1):
+            if password[i - size:i] == password[i - 2 * size:i - size]:
+                consider(i - size, 1 + math.log2(size), "повтор")
+
+        # последовательности: abc, 123, 987
+        delta = ord(char) - ord(password[i - 2]) if i > 1 else 0
+        if abs(delta) == 1 and (char.isdigit() == password[i - 2].isdigit()) and char.isalnum():
+            sequence = previous["sequence"] if previous["delta"] == delta else i - 2
+        else:
+            sequence, delta = i - 1, 0
+        if i - sequence >= 3:
+            consider(sequence, math.log2(10 if char.isdigit() else 26) + math.log2(i - sequence) + 1,
+                     "последовательность")
+
+        # проходы по соседним клавишам: qwerty, 1qaz, йцукен
+        direction = keyboard_direction(password[i - 2], char) if i > 1 else None
+        if direction is None:
+            walk, turns = i - 1, 0
+        elif previous["direction"] is not None:
+            walk, turns = previous["walk"], previous["turns"] + (direction != previous["direction"])
+        else:
+            walk, turns = i - 2, 0
+        if i - walk >= 3:
+            shifted = any(c.isupper() or c in PUNCTUATION for c in password[walk:i])
+            consider(walk, math.log2(KEYBOARD_KEYS) + math.log2(i - walk) + 2 * turns + shifted,
+                     "клавиатура")
+
+        # даты: 1990, 0102, 010290, 01.02.1990
+        for size in (4, 6, 8, 10):
+            if i >= size:
+                bits = date_bits(password[i - size:i])
+                if bits is not None:
+                    consider(i - size, bits, "дата")
+
+        return {
+            "bits": best, "match": match, "words": tuple(words),
+            "run": run, "sequence": sequence, "delta": delta,
+            "walk": walk, "direction": direction, "turns": turns,
+        }
+
+
+def estimate(password, dictionary=None):
+    """разовая оценка пароля без сохранения состояния"""
+    return StrengthEstimator(dictionary).estimate(password)
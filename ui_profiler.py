@@ -0,0 +1,200 @@
+# ui_profiler.py
+"""режим профилирования окна: python main.py --profile [отчет.json]
+
+замеряет время слотов, задержку цикла событий qt и снимает стек потока
+интерфейса, когда он занят дольше порога. по выходе пишет json-отчет,
+а если включен cProfile для действий - еще и файл pstats рядом с ним"""
+import cProfile
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from PyQt6.QtCore import QTimer
+
+from query_stats import LATENCY_BUCKETS_MS, latency_stats, record_latency
+
+
+def _positional_limit(fn):
+    """сколько позиционных аргументов принимает fn, None - без ограничения
+
+    qt передает слоту все аргументы сигнала (например checked у clicked) и сам
+    отбрасывает лишние, только если видит сигнатуру слота. обертка принимает *args,
+    поэтому лишние аргументы отбрасывает она"""
+    parameters = list(inspect.signature(fn).parameters.values())
+    if any(parameter.kind is parameter.VAR_POSITIONAL for parameter in parameters):
+        return None
+    return sum(1 for parameter in parameters
+               if parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD))
+
+
+class UIProfiler:
+    """собирает время слотов, задержки цикла событий и образцы стека при зависаниях
+
+    instrument() нужно вызвать до создания окна: кнопки подключаются к связанным
+    методам в init_ui, и подмена метода после этого уже ничего не изменит"""
+
+    def __init__(self, threshold_ms=100.0, interval_ms=50, profile_actions=(), max_samples=200):
+        self.threshold_ms = threshold_ms
+        self.interval_ms = interval_ms
+        self.profile_actions = set(profile_actions)
+        self._slots = {}
+        self._active = []
+        # задержки цикла событий: один замер на тик таймера
+        self._lag = latency_stats()
+        self._stalls = deque(maxlen=max_samples)
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        self._profile = cProfile.Profile() if self.profile_actions else None
+        self._profile_depth = 0
+        self._started = None
+        self._last_tick = None
+        self._gui_thread = None
+        self._stop = threading.Event()
+        self._timer = None
+        self._watchdog = None
+
+    def instrument(self, cls, names):
+        """оборачивает методы класса замером времени"""
+        for name in names:
+            fn = cls.__dict__.get(name)
+            if not inspect.isfunction(fn):
+                raise ValueError(f"{cls.__name__}.{name} не является методом")
+            setattr(cls, name, self._wrap(f"{cls.__name__}.{name}", fn))
+
+    def _wrap(self, label, fn):
+        limit = _positional_limit(fn)
+        profiled = label in self.profile_actions or label.rsplit(".", 1)[-1] in self.profile_actions
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if limit is not None:
+                args = args[:limit]
+            self._active.append(label)
+            if profiled:
+                self._enable_profile()
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                if profiled:
+                    self._disable_profile()
+                self._active.pop()
+                self._record_slot(label, elapsed_ms)
+
+        return wrapper
+
+    def _enable_profile(self):
+        # слот может вызвать другой профилируемый слот, например из модального диалога
+        if self._profile_depth == 0:
+            self._profile.enable()
+        self._profile_depth += 1
+
+    def _disable_profile(self):
+        self._profile_depth -= 1
+        if self._profile_depth == 0:
+            self._profile.disable()
+
+    def _record_slot(self, label, elapsed_ms):
+        with self._lock:
+            stats = self._slots.get(label)
+            if stats is None:
+                stats = self._slots[label] = latency_stats()
+            record_latency(stats, elapsed_ms)
+
+    def start(self):
+        """запускает таймер в потоке интерфейса и сторожевой поток, нужен созданный QApplication"""
+        self._gui_thread = threading.get_ident()
+        self._started = self._last_tick = time.monotonic()
+        self._timer = QTimer()
+        self._timer.setInterval(self.interval_ms)
+        self._timer.timeout.connect(self._tick)
+        self._timer.start()
+        self._watchdog = threading.Thread(target=self._watch, name="ui-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.stop()
+        self._stop.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+
+    def _tick(self):
+        """таймер в потоке интерфейса: опоздание тика - это задержка цикла событий"""
+        now = time.monotonic()
+        lag_ms = max(0.0, (now - self._last_tick) * 1000 - self.interval_ms)
+        self._last_tick = now
+        with self._lock:
+            record_latency(self._lag, lag_ms)
+            if lag_ms >= self.threshold_ms:
+                self._stalls.append({
+                    "at_s": round(now - self._started - lag_ms / 1000, 3),
+                    "blocked_ms": round(lag_ms, 1),
+                })
+
+    def _watch(self):
+        """сторожевой поток: пока тики не приходят дольше порога, снимает стек потока интерфейса"""
+        threshold = self.threshold_ms / 1000
+        sampled_tick = None
+        next_sample = 0.0
+        while not self._stop.wait(threshold / 2):
+            last_tick = self._last_tick
+            blocked = time.monotonic() - last_tick - self.interval_ms / 1000
+            if blocked < threshold:
+                continue
+            if sampled_tick != last_tick:
+                # новое зависание: первый снимок сразу, следующие - через каждый порог
+                sampled_tick = last_tick
+                next_sample = 0.0
+            if blocked < next_sample:
+                continue
+            next_sample = blocked + threshold
+            frame = sys._current_frames().get(self._gui_thread)
+            if frame is None:
+                continue
+            stack = [line.rstrip() for line in traceback.format_stack(frame, limit=30)]
+            with self._lock:
+                self._samples.append({
+                    "at_s": round(time.monotonic() - self._started, 3),
+                    "blocked_ms": round(blocked * 1000, 1),
+                    "slots": list(self._active),
+                    "stack": stack,
+                })
+
+    def report(self):
+        """отчет в виде словаря, готового для json"""
+        with self._lock:
+            slots = [dict(stats, slot=label, mean_ms=stats["total_ms"] / stats["count"])
+                     for label, stats in self._slots.items()]
+            report = {
+                "buckets_ms": [str(bound) for bound in LATENCY_BUCKETS_MS],
+                "threshold_ms": self.threshold_ms,
+                "duration_s": round(time.monotonic() - self._started, 3) if self._started else 0.0,
+                "slots": sorted(slots, key=lambda stats: stats["total_ms"], reverse=True),
+                "event_loop": {
+                    "interval_ms": self.interval_ms,
+                    "ticks": self._lag["count"],
+                    "max_lag_ms": round(self._lag["max_ms"], 1),
+                    "lag_histogram": list(self._lag["histogram"]),
+                },
+                "stalls": list(self._stalls),
+                "stack_samples": list(self._samples),
+            }
+        return report
+
+    def write(self, file_name):
+        """пишет json-отчет, а при включенном cProfile - file_name без расширения + .pstats"""
+        report = self.report()
+        if self._profile is not None:
+            report["pstats"] = os.path.splitext(file_name)[0] + ".pstats"
+            self._profile.dump_stats(report["pstats"])
+        with open(file_name, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        return report
@@ -0,0 +1,162 @@
+# vault_cache.py
+import sys
+import threading
+from collections import OrderedDict
+
+# колонки, которые кэш хранит вытесняемыми и отдает через payload
+PAYLOAD_COLUMNS = ("password", "note")
+
+
+class VaultCache:
+    """кэш записей между окном и DBHandler
+
+    названия и логины вытесняются по принципу LRU, когда записей больше max_rows, а пароли
+    и заметки - раньше, когда их суммарный размер превышает max_payload_bytes. вытесненная
+    запись просто перечитывается из базы при следующем обращении"""
+
+    def __init__(self, db, max_payload_bytes=8 * 1024 * 1024, max_rows=100_000):
+        self.db = db
+        self.max_payload_bytes = max_payload_bytes
+        self.max_rows = max_rows
+        # id -> (id, name, username), порядок - от холодных к горячим
+        self._rows = OrderedDict()
+        # id -> (password, note), порядок - от холодных к горячим
+        self._payloads = OrderedDict()
+        self._payload_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_page(self, filter_text="", sort_column="id", descending=False, after_key=None, limit=200):
+        """загружает страницу из базы, кладет её в кэш и возвращает id строк
+
+        after_key - ключ последней уже загруженной строки, см. DBHandler.get_passwords_page"""
+        rows = self.db.get_passwords_page(filter_text, sort_column, descending, after_key, limit)
+        with self._lock:
+            for row in rows:
+                self._store(row)
+        return [row[0] for row in rows]
+
+    def row(self, password_id):
+        """возвращает (id, name, username) записи"""
+        with self._lock:
+            row = self._rows.get(password_id)
+            if row is not None:
+                self.hits += 1
+                self._rows.move_to_end(password_id)
+                return row
+        return self._load(password_id)[:3]
+
+    def payload(self, password_id):
+        """возвращает (password, note) записи, при промахе читает её из базы"""
+        with self._lock:
+            payload = self._payloads.get(password_id)
+            if payload is not None:
+                self.hits += 1
+                self._payloads.move_to_end(password_id)
+                return payload
+        return self._load(password_id)[3:5]
+
+    def peek(self, password_id):
+        """возвращает (id, name, username, password, note) только из кэша, без обращения к базе
+
+        при промахе возвращает None: вызывающий сам решает, где и когда читать базу"""
+        with self._lock:
+            row = self._rows.get(password_id)
+            payload = self._payloads.get(password_id)
+            if row is None or payload is None:
+                return None
+            self.hits += 1
+            self._rows.move_to_end(password_id)
+            self._payloads.move_to_end(password_id)
+            return row + payload
+
+    def reveal(self, password_id, column):
+        """расшифрованное значение колонки password или note; в кэше лежат шифротексты"""
+        payload = self.payload(password_id)
+        return self.db.reveal(payload[PAYLOAD_COLUMNS.index(column)], column, password_id)
+
+    def add_password(self, name, username, password, note=""):
+        """добавляет запись в базу и в кэш, возвращает id новой записи"""
+        password_id = self.db.add_password(name, username, password, note)
+        if password_id is not None:
+            # в базе запись может храниться зашифрованной, поэтому перечитаем её при обращении
+            self.invalidate([password_id])
+        return password_id
+
+    def refresh(self, rows):
+        """заменяет закэшированные записи свежими строками базы"""
+        with self._lock:
+            for row in rows:
+                self._store(row)
+
+    def delete_passwords(self, password_ids):
+        """удаляет записи из базы одной транзакцией и из кэша, возвращает id удаленных"""
+        deleted = self.db.delete_passwords(password_ids)
+        self.invalidate(deleted)
+        return deleted
+
+    def invalidate(self, password_ids):
+        """забывает записи, чтобы следующее обращение перечитало их из базы"""
+        with self._lock:
+            for password_id in password_ids:
+                self._rows.pop(password_id, None)
+                self._drop_payload(password_id)
+
+    def clear(self):
+        """полностью очищает кэш"""
+        with self._lock:
+            self._rows.clear()
+            self._payloads.clear()
+            self._payload_bytes = 0
+
+    def stats(self):
+        """счетчики попаданий и промахов и текущий размер кэша"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "rows": len(self._rows),
+                "payloads": len(self._payloads),
+                "payload_bytes": self._payload_bytes,
+            }
+
+    def _load(self, password_id):
+        """промах: читает запись из базы"""
+        row = self.db.get_password_by_id(password_id)
+        with self._lock:
+            self.misses += 1
+            if row is None:
+                return (password_id, "", "", "", "")
+            self._store(row)
+        return row
+
+    def _store(self, row):
+        """кладет строку базы в кэш, вызывается под блокировкой"""
+        password_id, name, username, password, note = row[:5]
+        self._rows[password_id] = (password_id, name, username)
+        self._rows.move_to_end(password_id)
+        self._drop_payload(password_id)
+        self._payloads[password_id] = (password, note)
+        self._payload_bytes += self._payload_size(password, note)
+        # вытесняем самые холодные пароли и заметки, названия остаются
+        while self._payload_bytes > self.max_payload_bytes and len(self._payloads) > 1:
+            _, (old_password, old_note) = self._payloads.popitem(last=False)
+            self._payload_bytes -= self._payload_size(old_password, old_note)
+            self.evictions += 1
+        # самые холодные записи забываются целиком вместе с паролем и заметкой
+        while len(self._rows) > self.max_rows:
+            old_id, _ = self._rows.popitem(last=False)
+            self._drop_payload(old_id)
+            self.evictions += 1
+
+    def _drop_payload(self, password_id):
+        payload = self._payloads.pop(password_id, None)
+        if payload is not None:
+            self._payload_bytes -= self._payload_size(*payload)
+
+    @staticmethod
+    def _payload_size(password, note):
+        return sys.getsizeof(password) + sys.getsizeof(note)
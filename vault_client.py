@@ -0,0 +1,181 @@
+# vault_client.py
+"""клиент vault_daemon и генератор нагрузки для него
+
+в скрипте:
+    from vault_client import VaultClient
+    with VaultClient("password-manager.sock") as client:
+        print(client.get(name="example.com"))
+
+замер задержек:
+    python vault_client.py --socket password-manager.sock --connections 8 --depth 16 --seconds 10
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import socket
+import sys
+import time
+
+from exceptions import PasswordManagerError
+from vault_protocol import encode, read_message, recv_message
+
+
+class VaultClient:
+    """блокирующий клиент: одно соединение, запросы можно слать пачкой через pipeline"""
+
+    def __init__(self, socket_path="password-manager.sock", timeout=10.0):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(socket_path)
+        self._file = self._socket.makefile("rb")
+        self._seq = itertools.count(1)
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def call(self, op, **params):
+        return self.pipeline([dict(params, op=op)])[0]
+
+    def pipeline(self, requests):
+        """отправляет все запросы одним пакетом и возвращает результаты в том же порядке
+
+        ответы читаются все, даже если какой-то запрос не удался: иначе остаток пачки
+        остался бы в сокете и попал бы в ответ следующего вызова. затем первая по
+        порядку запросов ошибка выбрасывается как PasswordManagerError"""
+        order = {}
+        frames = []
+        for index, request in enumerate(requests):
+            seq = next(self._seq)
+            order[seq] = index
+            frames.append(encode(dict(request, seq=seq)))
+        self._socket.sendall(b"".join(frames))
+
+        results = [None] * len(requests)
+        errors = {}
+        for _ in requests:
+            response = recv_message(self._file)
+            index = order.get(response["seq"])
+            if index is None:
+                # ответ без известного номера: демон не понял кадр, соединение дальше не годится
+                self.close()
+                raise PasswordManagerError(response.get("error") or "неожиданный ответ демона")
+            if response["ok"]:
+                results[index] = response["result"]
+            else:
+                errors[index] = response["error"]
+        if errors:
+            raise PasswordManagerError(errors[min(errors)])
+        return results
+
+    def get(self, password_id=None, name=None, username=None):
+        """запись по id или список записей по названию (и логину)"""
+        if password_id is not None:
+            return self.call("get", id=password_id)
+        params = {"name": name}
+        if username is not None:
+            params["username"] = username
+        return self.call("get", **params)
+
+    def search(self, text, limit=20):
+        return self.call("search", text=text, limit=limit)
+
+    def add(self, name, username, password, note=""):
+        """добавляет запись, возвращает её id после фиксации"""
+        return self.call("add", name=name, username=username, password=password, note=note)["id"]
+
+    def generate(self, length=16, count=1):
+        return self.call("generate", length=length, count=count)
+
+    def stats(self):
+        return self.call("stats")
+
+    def unlock(self, master_password):
+        """возвращает демону ключ зашифрованной базы, забытый после простоя"""
+        return self.call("unlock", master_password=master_password)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def load_connection(socket_path, depth, write_ratio, names, deadline, latencies, failures):
+    """одно соединение держит в полете depth запросов, пока не выйдет время"""
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    sent = {}
+    seq = itertools.count(1)
+
+    def send():
+        number = next(seq)
+        if random.random() < write_ratio:
+            request = {"op": "add", "name": f"load-{number}", "username": "load", "password": "load-password"}
+        else:
+            request = {"op": "get", "name": random.choice(names)}
+        request["seq"] = number
+        sent[number] = time.perf_counter()
+        writer.write(encode(request))
+
+    for _ in range(depth):
+        send()
+    while sent:
+        response = await read_message(reader)
+        latencies.append(time.perf_counter() - sent.pop(response["seq"]))
+        if not response["ok"]:
+            failures.append(response["error"])
+        if time.perf_counter() < deadline:
+            send()
+        await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run_load(socket_path, connections, depth, seconds, write_ratio):
+    with VaultClient(socket_path) as client:
+        names = [row["name"] for row in client.search("", limit=1000)] or ["missing"]
+    latencies = []
+    failures = []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        load_connection(socket_path, depth, write_ratio, names, started + seconds, latencies, failures)
+        for _ in range(connections)
+    ))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(failures),
+        "requests_per_second": round(len(latencies) / elapsed),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="генератор нагрузки для vault_daemon")
+    parser.add_argument("--socket", default="password-manager.sock")
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--depth", type=int, default=16, help="запросов в полете на одно соединение")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--write-ratio", type=float, default=0.0, help="доля запросов add")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load(args.socket, args.connections, args.depth, args.seconds, args.write_ratio))
+    with VaultClient(args.socket) as client:
+        report["daemon"] = client.stats()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# vault_crypto.py
+import hashlib
+import hmac
+import os
+import time
+
+from exceptions import DatabaseError, InvalidMasterPasswordError, VaultLockedError
+
+# первый байт блоба - схема шифрования. записывается всегда схема на hmac-sha256 из
+# стандартной библиотеки, чтобы формат базы не зависел от установленных пакетов,
+# и в тег входит id записи. блобы ранних сборок (hmac без id записи и AES-GCM при
+# установленном cryptography) читаются и переписываются при смене мастер-пароля
+SCHEME_HMAC_CTR = 1
+SCHEME_AES_GCM = 2
+SCHEME_HMAC_CTR_ROW = 3
+NONCE_LENGTH = {SCHEME_HMAC_CTR: 16, SCHEME_AES_GCM: 12, SCHEME_HMAC_CTR_ROW: 16}
+TAG_LENGTH = 16
+
+# scrypt с N=2**15, r=8 требует 32 МБ памяти и заметное время на каждую попытку подбора
+KDF_N = 2 ** 15
+KDF_R = 8
+KDF_P = 1
+
+
+def derive_keys(master_password, salt, n=KDF_N, r=KDF_R, p=KDF_P):
+    """выводит из мастер-пароля ключ шифрования и ключ аутентификации по 32 байта"""
+    material = hashlib.scrypt(
+        master_password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+        maxmem=256 * n * r + 1024 * 1024, dklen=64,
+    )
+    return material[:32], material[32:]
+
+
+class VaultCipher:
+    """ключ хранилища на время сессии и шифрование отдельных значений
+
+    ключ выводится из мастер-пароля один раз при unlock и живет в памяти, пока
+    к нему обращаются; после idle_timeout секунд простоя он забывается, и
+    следующее обращение требует ввести мастер-пароль снова.
+    каждое значение шифруется отдельно со своим случайным nonce и тегом
+    аутентификации, имя колонки и id записи входят в тег: шифротекст нельзя
+    незаметно подменить, переставить из колонки пароля в заметку или в другую запись"""
+
+    def __init__(self, salt, n=KDF_N, r=KDF_R, p=KDF_P, idle_timeout=300):
+        self.salt = salt
+        self.n = n
+        self.r = r
+        self.p = p
+        self.idle_timeout = idle_timeout
+        self._keys = None
+        self._last_used = 0.0
+
+    @classmethod
+    def create(cls, master_password, n=KDF_N, r=KDF_R, p=KDF_P, idle_timeout=300):
+        """новый ключ со случайной солью, уже разблокированный"""
+        cipher = cls(os.urandom(16), n, r, p, idle_timeout)
+        cipher._keys = derive_keys(master_password, cipher.salt, n, r, p)
+        cipher._last_used = time.monotonic()
+        return cipher
+
+    @property
+    def params(self):
+        """параметры kdf для хранения рядом с солью"""
+        return f"{self.n},{self.r},{self.p}"
+
+    @classmethod
+    def from_params(cls, salt, params, idle_timeout=300):
+        n, r, p = (int(value) for value in params.split(","))
+        return cls(salt, n, r, p, idle_timeout)
+
+    @property
+    def locked(self):
+        if self._keys is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self.lock()
+        return self._keys is None
+
+    def unlock(self, master_password, verifier):
+        """выводит ключ и сверяет его с проверочным значением из базы"""
+        keys = derive_keys(master_password, self.salt, self.n, self.r, self.p)
+        if not hmac.compare_digest(self._verifier(keys), verifier):
+            raise InvalidMasterPasswordError()
+        self._keys = keys
+        self._last_used = time.monotonic()
+
+    def lock(self):
+        """забывает ключ; python не дает надежно затереть память, поэтому просто отпускаем ссылку"""
+        self._keys = None
+
+    def verifier(self):
+        """проверочное значение для unlock, по нему нельзя восстановить ключ"""
+        return self._verifier(self._current_keys())
+
+    def subkey(self, label):
+        """независимый ключ для других целей, например для отпечатков паролей"""
+        return hmac.digest(self._current_keys()[1], b"subkey:" + label, "sha256")
+
+    def encrypt(self, value, column, row_id):
+        """шифрует строку и возвращает блоб: схема, nonce, шифротекст, тег"""
+        enc_key, mac_key = self._current_keys()
+        data = value.encode("utf-8")
+        aad = self._associated_data(SCHEME_HMAC_CTR_ROW, column, row_id)
+        nonce = os.urandom(NONCE_LENGTH[SCHEME_HMAC_CTR_ROW])
+        header = bytes([SCHEME_HMAC_CTR_ROW])
+        ciphertext = self._xor_keystream(enc_key, nonce, data)
+        tag = hmac.digest(mac_key, header + aad + b"\0" + nonce + ciphertext, "sha256")[:TAG_LENGTH]
+        return header + nonce + ciphertext + tag
+
+    def decrypt(self, blob, column, row_id):
+        """проверяет тег и расшифровывает блоб, созданный encrypt для той же колонки и записи"""
+        enc_key, mac_key = self._current_keys()
+        blob = bytes(blob)
+        scheme = blob[0] if blob else None
+        if scheme not in NONCE_LENGTH:
+            raise DatabaseError("Неизвестный формат зашифрованной записи.")
+        header = blob[:1]
+        aad = self._associated_data(scheme, column, row_id)
+        nonce_end = 1 + NONCE_LENGTH[scheme]
+        nonce = blob[1:nonce_end]
+        if scheme == SCHEME_AES_GCM:
+            # cryptography нужен только для старых записей, его импорт заметно замедляет запуск
+            try:
+                from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+            except ImportError:
+                raise DatabaseError("Запись зашифрована AES-GCM, установите пакет cryptography.") from None
+            try:
+                return AESGCM(enc_key).decrypt(nonce, blob[nonce_end:], header + aad).decode("utf-8")
+            except Exception as e:
+                raise DatabaseError("Не удалось расшифровать запись: данные повреждены.") from e
+        if len(blob) < nonce_end + TAG_LENGTH:
+            raise DatabaseError("Не удалось расшифровать запись: данные повреждены.")
+        ciphertext, tag = blob[nonce_end:-TAG_LENGTH], blob[-TAG_LENGTH:]
+        expected = hmac.digest(mac_key, header + aad + b"\0" + nonce + ciphertext, "sha256")[:TAG_LENGTH]
+        if not hmac.compare_digest(tag, expected):
+            raise DatabaseError("Не удалось расшифровать запись: данные повреждены.")
+        return self._xor_keystream(enc_key, nonce, ciphertext).decode("utf-8")
+
+    def _current_keys(self):
+        if self.locked:
+            raise VaultLockedError()
+        self._last_used = time.monotonic()
+        return self._keys
+
+    @staticmethod
+    def _associated_data(scheme, column, row_id):
+        """данные, которые входят в тег, но не шифруются; старые схемы не знали id записи"""
+        if scheme == SCHEME_HMAC_CTR_ROW:
+            return b"%s:%d" % (column.encode("ascii"), row_id)
+        return column.encode("ascii")
+
+    @staticmethod
+    def _verifier(keys):
+        return hmac.digest(keys[1], b"vault verifier", "sha256")
+
+    @staticmethod
+    def _xor_keystream(key, nonce, data):
+        """режим счетчика на hmac-sha256: блок потока ключей - hmac(key, nonce || номер блока)"""
+        if not data:
+            return b""
+        keystream = b"".join(
+            hmac.digest(key, nonce + counter.to_bytes(4, "big"), "sha256")
+            for counter in range((len(data) + 31) // 32)
+        )
+        # xor целых чисел быстрее, чем по байту в цикле python
+        mixed = int.from_bytes(data, "big") ^ int.from_bytes(keystream[:len(data)], "big")
+        return mixed.to_bytes(len(data), "big")
@@ -0,0 +1,378 @@
+# vault_daemon.py
+"""демон хранилища: одно соединение с базой и общий кэш для всех скриптов
+
+запуск:
+    python vault_daemon.py --db passwords.db --socket /tmp/password-manager.sock
+
+протокол описан в vault_protocol. запросы:
+    {"seq": 1, "op": "get", "id": 5}
+    {"seq": 2, "op": "get", "name": "example.com", "username": "bob"}
+    {"seq": 3, "op": "search", "text": "exam", "limit": 20}
+    {"seq": 4, "op": "add", "name": "...", "username": "...", "password": "...", "note": ""}
+    {"seq": 5, "op": "generate", "length": 16, "count": 1}
+    {"seq": 6, "op": "stats"}
+    {"seq": 7, "op": "unlock", "master_password": "..."}
+ответ: {"seq": ..., "ok": true, "result": ...} или {"seq": ..., "ok": false, "error": "..."}
+
+все обращения к базе идут через один рабочий поток, поэтому у демона одно
+соединение. добавления копятся commit_interval секунд и фиксируются одной
+транзакцией (group commit), каждая запись - в своей точке сохранения. поиск по названию и логину отвечает из индекса
+в памяти, изменения от других процессов подтягиваются по PRAGMA data_version"""
+import argparse
+import asyncio
+import math
+import os
+import signal
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from db_handler import DBHandler
+from exceptions import DatabaseError, PasswordManagerError
+from password_generator import PasswordGenerator
+from vault_cache import VaultCache
+from vault_protocol import encode, read_message
+
+MAX_GENERATE = 1000
+MAX_GENERATE_LENGTH = 1024
+MAX_SEARCH = 1000
+
+
+class VaultDaemon:
+    def __init__(self, db_name, socket_path, master_password=None, commit_interval=0.002,
+                 max_batch=1000, poll_interval=1.0, idle_timeout=math.inf):
+        self.db_name = db_name
+        self.socket_path = socket_path
+        self.master_password = master_password
+        self.commit_interval = commit_interval
+        self.max_batch = max_batch
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.db = None
+        self.cache = None
+        # один поток - одно соединение sqlite на весь демон
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vault-db")
+        # name.lower() -> id записей и обратно
+        self._names = {}
+        self._name_of = {}
+        self._pending = []
+        self._wakeup = None
+        self._server = None
+        self._flusher = None
+        self._watcher = None
+        self._closing = False
+        self._version = None
+        self._marker = None
+        self.stats = {"requests": 0, "errors": 0, "commits": 0, "committed_rows": 0, "connections": 0}
+
+    async def run_db(self, fn, *args):
+        """выполняет fn в потоке базы"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def start(self):
+        self.db = await self.run_db(DBHandler, self.db_name)
+        if self.db.encrypted:
+            # по умолчанию демон не забывает ключ: мастер-пароль ввести некому.
+            # с конечным idle_timeout после простоя ключ возвращает операция unlock
+            self.db.cipher.idle_timeout = self.idle_timeout
+            if self.master_password is None:
+                import getpass
+                self.master_password = getpass.getpass("Мастер-пароль: ")
+            await self.run_db(self.db.unlock, self.master_password)
+            self.master_password = None
+        self.cache = VaultCache(self.db)
+        await self.run_db(self._load_index)
+
+        self._wakeup = asyncio.Event()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        # сокет доступен только владельцу: через него выдаются пароли
+        old_umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        finally:
+            os.umask(old_umask)
+        self._flusher = asyncio.create_task(self._flush_loop())
+        self._watcher = asyncio.create_task(self._watch_loop())
+
+    async def serve_forever(self):
+        """обслуживает клиентов до SIGINT или SIGTERM, затем дописывает очередь и убирает сокет"""
+        await self.start()
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stopped.set)
+        try:
+            await stopped.wait()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+        if self._flusher is not None:
+            # сборщик дописывает уже принятые добавления и завершается
+            self._closing = True
+            self._wakeup.set()
+            await self._flusher
+        if self.db is not None:
+            await self.run_db(self.db.close)
+        self._executor.shutdown()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    # --- индекс в памяти ---
+
+    def _load_index(self):
+        """читает названия и логины всех записей, пароли остаются в базе до первого запроса"""
+        self._version = self.db.data_version()
+        self._marker = self.db.get_change_marker()
+        for password_id, name, _ in self.db.iter_names():
+            self._index(password_id, name)
+
+    def _index(self, password_id, name):
+        key = name.lower()
+        self._names.setdefault(key, set()).add(password_id)
+        self._name_of[password_id] = key
+
+    def _unindex(self, password_id):
+        key = self._name_of.pop(password_id, None)
+        if key is None:
+            return
+        ids = self._names[key]
+        ids.discard(password_id)
+        if not ids:
+            del self._names[key]
+
+    async def _watch_loop(self):
+        """подтягивает изменения других процессов, как ChangeWatcher в окне"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                changes = await self.run_db(self._poll)
+            except (PasswordManagerError, sqlite3.Error):
+                # база занята дольше busy_timeout или недоступна: попробуем на следующем тике
+                continue
+            if changes is None:
+                continue
+            rows, deleted_ids = changes
+            for password_id in deleted_ids + [row[0] for row in rows]:
+                self._unindex(password_id)
+            self.cache.invalidate(deleted_ids)
+            self.cache.refresh(rows)
+            for row in rows:
+                self._index(row[0], row[1])
+
+    def _poll(self):
+        version = self.db.data_version()
+        if version == self._version:
+            return None
+        rows, deleted_ids, self._marker = self.db.get_changes_since(self._marker)
+        self._version = version
+        return rows, deleted_ids
+
+    # --- group commit ---
+
+    async def _flush_loop(self):
+        while True:
+            await self._wakeup.wait()
+            if self._closing:
+                while self._pending:
+                    await self._flush()
+                return
+            # даем соседним запросам попасть в ту же транзакцию
+            await asyncio.sleep(self.commit_interval)
+            await self._flush()
+
+    async def _flush(self):
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        if not self._pending:
+            self._wakeup.clear()
+        if not batch:
+            return
+        try:
+            results = await self.run_db(self._commit, [row for _, row in batch])
+        except Exception as e:
+            # не удалась сама транзакция, например база занята: ни одна запись не сохранена
+            if not isinstance(e, PasswordManagerError):
+                e = DatabaseError(str(e))
+            for future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.stats["commits"] += 1
+        for (future, row), result in zip(batch, results):
+            if isinstance(result, Exception):
+                if not future.done():
+                    future.set_exception(result)
+                continue
+            self.stats["committed_rows"] += 1
+            self._unindex(result)
+            self._index(result, row[0])
+            if not future.done():
+                future.set_result(result)
+
+    def _commit(self, rows):
+        """одна транзакция на пачку добавлений, каждая запись в своей точке сохранения
+
+        ошибка одной записи откатывает только её и достается только её клиенту.
+        возвращает для каждой строки id новой записи или исключение"""
+        results = []
+        with self.db.transaction():
+            for row in rows:
+                try:
+                    with self.db.transaction():
+                        password_id = self.db.add_password(*row)
+                except PasswordManagerError as e:
+                    results.append(e)
+                    continue
+                except sqlite3.Error as e:
+                    results.append(DatabaseError(str(e)))
+                    continue
+                results.append(password_id if password_id is not None
+                               else DatabaseError("Не удалось сохранить пароль."))
+        return results
+
+    # --- соединения и запросы ---
+
+    async def _handle(self, reader, writer):
+        self.stats["connections"] += 1
+        drain_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    message = await read_message(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except ValueError as e:
+                    writer.write(encode({"seq": None, "ok": False, "error": str(e)}))
+                    break
+                # запросы одного соединения выполняются параллельно, ответы идут по готовности
+                task = asyncio.create_task(self._respond(message, writer, drain_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    async def _respond(self, message, writer, drain_lock):
+        self.stats["requests"] += 1
+        seq = message.get("seq") if isinstance(message, dict) else None
+        try:
+            response = {"seq": seq, "ok": True, "result": await self.dispatch(message)}
+        except Exception as e:
+            # клиент ждет ответ на каждый seq: без него он упрется в таймаут
+            self.stats["errors"] += 1
+            response = {"seq": seq, "ok": False, "error": str(e) or type(e).__name__}
+        if writer.is_closing():
+            return
+        writer.write(encode(response))
+        async with drain_lock:
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    async def dispatch(self, message):
+        if not isinstance(message, dict):
+            raise ValueError("запрос должен быть json-объектом")
+        op = message.get("op")
+        if op == "get":
+            return await self._get(message)
+        if op == "search":
+            return await self._search(message)
+        if op == "add":
+            return await self._add(message)
+        if op == "generate":
+            # генерация тысяч паролей заметна по времени, цикл событий не должен ждать её
+            return await asyncio.get_running_loop().run_in_executor(None, self._generate, message)
+        if op == "unlock":
+            if self.db.encrypted:
+                await self.run_db(self.db.unlock, str(message["master_password"]))
+            return {"locked": self.db.locked}
+        if op == "stats":
+            return {**self.stats, "pending": len(self._pending), "names": len(self._names),
+                    "cache": self.cache.stats()}
+        raise ValueError(f"неизвестная операция: {op!r}")
+
+    async def _get(self, message):
+        if "id" in message:
+            return await self._record(int(message["id"]))
+        name = message["name"]
+        username = message.get("username")
+        if not isinstance(name, str) or not isinstance(username, (str, type(None))):
+            raise ValueError("название и логин должны быть строками")
+        records = []
+        for password_id in sorted(self._names.get(name.lower(), ())):
+            record = await self._record(password_id)
+            if record is not None and (username is None or record["username"] == username):
+                records.append(record)
+        return records
+
+    async def _record(self, password_id):
+        """запись с расшифрованными паролем и заметкой; попадание в кэш не ходит в поток базы"""
+        row = self.cache.peek(password_id)
+        if row is None:
+            row = await self.run_db(self.db.get_password_by_id, password_id)
+            if row is None:
+                return None
+            self.cache.refresh([row])
+        password_id, name, username, password, note = row[:5]
+        return {
+            "id": password_id, "name": name, "username": username,
+            "password": self.db.reveal(password, "password", password_id),
+            "note": self.db.reveal(note, "note", password_id),
+        }
+
+    async def _search(self, message):
+        text = str(message.get("text", ""))
+        # LIMIT -1 в sqlite означает "без ограничения", поэтому снизу тоже ограничиваем
+        limit = max(1, min(int(message.get("limit", 20)), MAX_SEARCH))
+        rows = await self.run_db(lambda: self.db.get_passwords_page(text, limit=limit))
+        self.cache.refresh(rows)
+        return [{"id": row[0], "name": row[1], "username": row[2]} for row in rows]
+
+    async def _add(self, message):
+        row = (str(message["name"]), str(message["username"]), str(message["password"]),
+               str(message.get("note", "")))
+        if not all(row[:3]):
+            raise ValueError("название, логин и пароль обязательны")
+        if self._closing:
+            raise ValueError("демон останавливается, запись не принята")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((future, row))
+        self._wakeup.set()
+        return {"id": await future}
+
+    @staticmethod
+    def _generate(message):
+        count = min(int(message.get("count", 1)), MAX_GENERATE)
+        length = min(int(message.get("length", 16)), MAX_GENERATE_LENGTH)
+        generator = PasswordGenerator(length, bool(message.get("digits", True)), bool(message.get("special", True)))
+        return generator.generate_many(count)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="демон хранилища паролей на unix-сокете")
+    parser.add_argument("--db", default="passwords.db", help="файл базы паролей")
+    parser.add_argument("--socket", default="password-manager.sock", help="путь к unix-сокету")
+    parser.add_argument("--commit-interval", type=float, default=0.002,
+                        help="сколько секунд копить добавления перед общей фиксацией")
+    parser.add_argument("--idle-timeout", type=float, default=math.inf,
+                        help="через сколько секунд простоя забыть ключ зашифрованной базы, "
+                             "вернуть его можно операцией unlock; по умолчанию не забывать")
+    args = parser.parse_args(argv)
+
+    daemon = VaultDaemon(args.db, args.socket, os.environ.get("PASSWORD_MANAGER_MASTER_PASSWORD"),
+                         commit_interval=args.commit_interval, idle_timeout=args.idle_timeout)
+    asyncio.run(daemon.serve_forever())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+# vault_protocol.py
+"""формат сообщений между vault_daemon и клиентами
+
+кадр - 4 байта длины (big-endian) и json в utf-8. запрос несет номер seq,
+ответ возвращает тот же seq: клиент может отправить много запросов подряд,
+не дожидаясь ответов, и сопоставить ответы по номеру"""
+import json
+import struct
+
+HEADER = struct.Struct(">I")
+# ограничение защищает демон от клиента, приславшего мусор вместо длины
+MAX_FRAME = 1024 * 1024
+
+
+def encode(message):
+    """сообщение -> кадр для отправки"""
+    payload = json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return HEADER.pack(len(payload)) + payload
+
+
+def decode(payload):
+    return json.loads(payload)
+
+
+def check_size(size):
+    if size > MAX_FRAME:
+        raise ValueError(f"кадр {size} байт больше допустимых {MAX_FRAME}")
+    return size
+
+
+async def read_message(reader):
+    """читает один кадр из asyncio.StreamReader"""
+    header = await reader.readexactly(HEADER.size)
+    size = check_size(HEADER.unpack(header)[0])
+    return decode(await reader.readexactly(size))
+
+
+def recv_message(file):
+    """читает один кадр из блокирующего файла сокета (socket.makefile("rb"))"""
+    header = file.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ConnectionError("соединение закрыто")
+    size = check_size(HEADER.unpack(header)[0])
+    payload = file.read(size)
+    if len(payload) < size:
+        raise ConnectionError("соединение закрыто")
+    return decode(payload)